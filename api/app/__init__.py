@@ -3,20 +3,167 @@ from .config import Config
 from flask_cors import CORS
 from app.utils.auth_utils import initialize_token_cache
 
+def build_diagnosis_context(app):
+    """Start building the precomputed diagnosis context table; diagnoses use live retrieval until it is ready"""
+    app.diagnosis_context.build_in_background()
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     CORS(app)
     
+    # Parse multipart uploads straight into memory with the image size limit and format check
+    from app.utils.image_upload import ImageUploadRequest
+    app.request_class = ImageUploadRequest
+    
     # Initialize token cache
     initialize_token_cache(app)
 
     # Vector store initialization happens lazily in rag_service.py
     
-    # Warm up models
+    # Bound how many image inferences run at once in this worker
+    from app.utils.inference_scheduler import InferenceScheduler
+    app.inference_scheduler = InferenceScheduler(
+        max_concurrency=app.config['INFERENCE_MAX_CONCURRENCY'],
+        max_queue=app.config['INFERENCE_MAX_QUEUE'],
+        default_deadline=app.config['INFERENCE_DEADLINE']
+    )
+    
+    # Build the per-worker diagnosis pipeline pool once and warm up its models
+    from app.services.diagnosis_service import DiagnosisPipelinePool, DiagnosisClassificationService
     from app.utils.model_warmup import warm_up_diagnosis_models
-    with app.app_context():
-        warm_up_diagnosis_models()
+    
+    classifier = None
+    if app.config['CLASSIFY_MICROBATCH_ENABLED']:
+        # All pipelines share one classifier that batches crops across concurrent requests
+        from app.services.classification_batcher import MicroBatchClassifier
+        classifier = MicroBatchClassifier(
+            lambda: DiagnosisClassificationService(
+                app.config.get('CLASSIFICATION_MODEL_PATH'),
+                app.config.get('CLASS_INDEX_PATH'),
+                max_batch=app.config['CLASSIFY_MICROBATCH_MAX_BATCH'],
+                num_threads=app.config['TFLITE_NUM_THREADS']
+            ),
+            max_batch=app.config['CLASSIFY_MICROBATCH_MAX_BATCH'],
+            max_wait_ms=app.config['CLASSIFY_MICROBATCH_MAX_WAIT_MS']
+        )
+    
+    app.diagnosis_pool = DiagnosisPipelinePool(
+        size=app.config['DIAGNOSIS_POOL_SIZE'],
+        detection_model_path=app.config.get('DETECTION_MODEL_PATH'),
+        classification_model_path=app.config.get('CLASSIFICATION_MODEL_PATH'),
+        class_index_path=app.config.get('CLASS_INDEX_PATH'),
+        checkout_timeout=app.config['DIAGNOSIS_POOL_TIMEOUT'],
+        num_threads=app.config['TFLITE_NUM_THREADS'],
+        classifier=classifier,
+        max_working_dimension=app.config['DIAGNOSIS_MAX_WORKING_RESOLUTION'],
+        crop_workers=app.config['DIAGNOSIS_CROP_WORKERS']
+    )
+    if app.config['PRELOAD_MODELS']:
+        # Running in the gunicorn master: only load the model files here, workers share them
+        # copy-on-write and build their interpreters in the post_fork hook (gunicorn.conf.py)
+        from app.utils.model_store import preload_model_content
+        preload_model_content(
+            app.config.get('DETECTION_MODEL_PATH'),
+            app.config.get('CLASSIFICATION_MODEL_PATH')
+        )
+    else:
+        with app.app_context():
+            warm_up_diagnosis_models(app.diagnosis_pool)
+    
+    # Cache diagnosis results by upload bytes and model digests
+    app.diagnosis_cache = None
+    if app.config['DIAGNOSIS_CACHE_ENABLED']:
+        from app.utils.result_cache import DiagnosisResultCache
+        app.diagnosis_cache = DiagnosisResultCache(
+            model_paths=[
+                app.config.get('DETECTION_MODEL_PATH'),
+                app.config.get('CLASSIFICATION_MODEL_PATH'),
+                app.config.get('CLASS_INDEX_PATH')
+            ],
+            max_entries=app.config['DIAGNOSIS_CACHE_MAX_ENTRIES'],
+            ttl=app.config['DIAGNOSIS_CACHE_TTL'],
+            disk_dir=app.config['DIAGNOSIS_CACHE_DIR'],
+            disk_max_entries=app.config['DIAGNOSIS_CACHE_DISK_MAX_ENTRIES']
+        )
+    
+    # Evaluate /question answers off the request path
+    app.evaluation_queue = None
+    if app.config['RELEVANCE_EVAL_ASYNC']:
+        from app.services.evaluation_queue import RelevanceEvaluationQueue
+        app.evaluation_queue = RelevanceEvaluationQueue(
+            app,
+            workers=app.config['RELEVANCE_EVAL_WORKERS'],
+            max_queue=app.config['RELEVANCE_EVAL_MAX_QUEUE'],
+            batch_size=app.config['RELEVANCE_EVAL_BATCH_SIZE'],
+            max_wait_ms=app.config['RELEVANCE_EVAL_MAX_WAIT_MS'],
+            enqueue_timeout=app.config['RELEVANCE_EVAL_ENQUEUE_TIMEOUT']
+        )
+    
+    # Reuse answers of semantically similar questions
+    app.answer_cache = None
+    if app.config['ANSWER_CACHE_ENABLED']:
+        from app.utils.answer_cache import SemanticAnswerCache
+        from app.services.rag_service import get_embeddings
+        app.answer_cache = SemanticAnswerCache(
+            lambda text: get_embeddings().embed_query(text),
+            threshold=app.config['ANSWER_CACHE_THRESHOLD'],
+            max_entries=app.config['ANSWER_CACHE_MAX_ENTRIES'],
+            ttl=app.config['ANSWER_CACHE_TTL'],
+            db_path=app.config['ANSWER_CACHE_DB']
+        )
+    
+    # Fit the local retrieval index up front (no network; shared copy-on-write under PRELOAD_MODELS)
+    if app.config['RETRIEVER_BACKEND'] in ("local", "auto"):
+        from app.services.local_retriever import get_local_index
+        try:
+            get_local_index(app)
+        except Exception as e:
+            app.logger.error(f"Error building local retrieval index: {str(e)}")
+    
+    # Embed the acne type labels up front; with PRELOAD_MODELS this happens per worker after fork
+    # (gunicorn.conf.py) so no Vertex AI client is created in the master
+    if app.config['EMBEDDING_CACHE_ENABLED'] and app.config['EMBEDDING_CACHE_PREWARM'] and not app.config['PRELOAD_MODELS']:
+        from app.services.rag_service import prewarm_label_embeddings
+        with app.app_context():
+            prewarm_label_embeddings()
+    
+    # Build the LCEL chains once; with PRELOAD_MODELS this happens per worker after fork
+    if not app.config['PRELOAD_MODELS']:
+        from app.services.rag_service import prebuild_chains
+        with app.app_context():
+            prebuild_chains()
+    
+    # Precompute the diagnosis retrieval context of acne type combinations in the background; with
+    # PRELOAD_MODELS this starts per worker after fork (gunicorn.conf.py), workers share it through the cache file
+    app.diagnosis_context = None
+    if app.config['DIAGNOSIS_CONTEXT_PRECOMPUTE']:
+        import json
+        from app.utils.context_table import DiagnosisContextTable
+        from app.services.rag_service import retrieve_acne_type_context, retrieve_combination_context, knowledge_base_fingerprint
+        with open(app.config['CLASS_INDEX_PATH'], "r") as f:
+            labels = list(json.load(f))
+        app.diagnosis_context = DiagnosisContextTable(
+            app,
+            labels,
+            resolve_type=retrieve_acne_type_context,
+            resolve_combination=retrieve_combination_context,
+            fingerprint_fn=knowledge_base_fingerprint,
+            check_interval=app.config['DIAGNOSIS_CONTEXT_CHECK_INTERVAL'],
+            cache_path=app.config['DIAGNOSIS_CONTEXT_CACHE_PATH'],
+            max_combination_size=app.config['DIAGNOSIS_CONTEXT_MAX_COMBINATION']
+        )
+        if not app.config['PRELOAD_MODELS']:
+            build_diagnosis_context(app)
+    
+    # Share one LLM call among identical concurrent requests
+    app.single_flight = None
+    if app.config['SINGLE_FLIGHT_ENABLED']:
+        from app.utils.single_flight import SingleFlight
+        app.single_flight = SingleFlight(
+            wait_timeout=app.config['SINGLE_FLIGHT_WAIT_TIMEOUT'],
+            lock_dir=app.config['SINGLE_FLIGHT_LOCK_DIR']
+        )
     
     # Register blueprints
     from app.routes import api_bp
@@ -39,21 +39,125 @@ class Config:
     LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', '0.7'))
     LLM_TOP_P = float(os.getenv('LLM_TOP_P', '0.95'))
     LLM_TIMEOUT = int(os.getenv('LLM_TIMEOUT', '60'))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '1'))
+    
+    # Per-endpoint latency budgets in seconds, shared by retrieval, generation and evaluation
+    QUESTION_DEADLINE = float(os.getenv('QUESTION_DEADLINE', '30'))
+    DIAGNOSIS_DEADLINE = float(os.getenv('DIAGNOSIS_DEADLINE', '45'))
+    COMBINED_DIAGNOSIS_DEADLINE = float(os.getenv('COMBINED_DIAGNOSIS_DEADLINE', '60'))
+    # Shortest budget an X-Deadline-Ms header may request, so clients cannot ask for instant timeouts
+    MIN_CLIENT_DEADLINE = float(os.getenv('MIN_CLIENT_DEADLINE', '1.0'))
+    
+    # Threads per worker running deadline-bounded (and hedged) Gemini calls
+    LLM_CALL_WORKERS = int(os.getenv('LLM_CALL_WORKERS', '16'))
+    # Hedged calls: start a second call once the first runs longer than the p95 latency (at least LLM_HEDGE_MIN_DELAY)
+    LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+    LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '1.0'))
+    # Streamed answers: longest wait for the next token once the first one arrived (the request deadline bounds the first)
+    LLM_STREAM_IDLE_TIMEOUT = float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', '15'))
+    # Fail fast for LLM_CIRCUIT_RESET_TIMEOUT seconds after this many consecutive Gemini failures
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', '5'))
+    LLM_CIRCUIT_RESET_TIMEOUT = float(os.getenv('LLM_CIRCUIT_RESET_TIMEOUT', '30'))
     
     # File storage paths
     UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'instance/uploads')
     CROP_DIR = os.getenv('CROP_DIR', 'instance/crops')
     RESULTS_DIR = os.getenv('RESULTS_DIR', 'instance/results')
     
+    # Upload limits: decoded image size, and whole request body (room for base64 overhead and JSON fields)
+    MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+    MAX_CONTENT_LENGTH = MAX_IMAGE_BYTES * 4 // 3 + 1024 * 1024
+    
     # ML models paths
     DETECTION_MODEL_PATH = os.getenv('DETECTION_MODEL_PATH', 'models/detection/yolo_v2.tflite')
     CLASSIFICATION_MODEL_PATH = os.getenv('CLASSIFICATION_MODEL_PATH', 'models/classification/efficientnet_v2.tflite')
     CLASS_INDEX_PATH = os.getenv('CLASS_INDEX_PATH', 'models/classification/labels.json')
     
+    # Diagnosis pipeline pool (one pipeline per gunicorn thread of a worker)
+    DIAGNOSIS_POOL_SIZE = int(os.getenv('DIAGNOSIS_POOL_SIZE', os.getenv('GUNICORN_THREADS', '1')))
+    DIAGNOSIS_POOL_TIMEOUT = float(os.getenv('DIAGNOSIS_POOL_TIMEOUT', '30'))
+    # Threads per worker preparing crops and encoding result panels (1 runs them serially). Every gunicorn
+    # worker has its own pool, so the default is this worker's share of the CPUs (at most 4)
+    DIAGNOSIS_CROP_WORKERS = int(os.getenv(
+        'DIAGNOSIS_CROP_WORKERS',
+        str(min(4, max(1, (os.cpu_count() or 1) // max(1, int(os.getenv('GUNICORN_WORKERS', '4'))))))
+    ))
+    
+    # Load model flatbuffers in the gunicorn master (--preload) and build interpreters after fork
+    PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'false').lower() == 'true'
+    # Threads per TFLite interpreter (0 lets TFLite decide)
+    TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', '0')) or None
+    
+    # Inference scheduling: concurrent image inferences per worker, wait queue and queue deadline (seconds)
+    INFERENCE_MAX_CONCURRENCY = int(os.getenv('INFERENCE_MAX_CONCURRENCY', str(DIAGNOSIS_POOL_SIZE)))
+    INFERENCE_MAX_QUEUE = int(os.getenv('INFERENCE_MAX_QUEUE', '4'))
+    INFERENCE_DEADLINE = float(os.getenv('INFERENCE_DEADLINE', '10'))
+    
+    # Micro-batch classification across concurrent requests (useful with GUNICORN_THREADS > 1)
+    CLASSIFY_MICROBATCH_ENABLED = os.getenv('CLASSIFY_MICROBATCH_ENABLED', 'false').lower() == 'true'
+    CLASSIFY_MICROBATCH_MAX_BATCH = int(os.getenv('CLASSIFY_MICROBATCH_MAX_BATCH', '32'))
+    CLASSIFY_MICROBATCH_MAX_WAIT_MS = float(os.getenv('CLASSIFY_MICROBATCH_MAX_WAIT_MS', '5'))
+    
+    # Image diagnosis result cache (set DIAGNOSIS_CACHE_DIR, e.g. /dev/shm/acne-sense-cache, to share hits across workers)
+    DIAGNOSIS_CACHE_ENABLED = os.getenv('DIAGNOSIS_CACHE_ENABLED', 'true').lower() == 'true'
+    DIAGNOSIS_CACHE_MAX_ENTRIES = int(os.getenv('DIAGNOSIS_CACHE_MAX_ENTRIES', '32'))
+    DIAGNOSIS_CACHE_TTL = int(os.getenv('DIAGNOSIS_CACHE_TTL', '3600'))
+    DIAGNOSIS_CACHE_DIR = os.getenv('DIAGNOSIS_CACHE_DIR', '')
+    DIAGNOSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv('DIAGNOSIS_CACHE_DISK_MAX_ENTRIES', '256'))
+    
+    # Default rendering of result images: none, annotated_only or all (overridable per request)
+    DIAGNOSIS_IMAGE_MODE = os.getenv('DIAGNOSIS_IMAGE_MODE', 'all')
+    DIAGNOSIS_JPEG_QUALITY = int(os.getenv('DIAGNOSIS_JPEG_QUALITY', '95'))
+    DIAGNOSIS_MAX_IMAGE_DIMENSION = int(os.getenv('DIAGNOSIS_MAX_IMAGE_DIMENSION', '0')) or None
+    
+    # Longest side of the working image uploads are decoded to (0 keeps the full resolution)
+    DIAGNOSIS_MAX_WORKING_RESOLUTION = int(os.getenv('DIAGNOSIS_MAX_WORKING_RESOLUTION', '2048')) or None
+    
+    # Relevance evaluation of /question answers runs on background threads and is written back to Supabase
+    RELEVANCE_EVAL_ASYNC = os.getenv('RELEVANCE_EVAL_ASYNC', 'true').lower() == 'true'
+    RELEVANCE_EVAL_WORKERS = int(os.getenv('RELEVANCE_EVAL_WORKERS', '1'))
+    RELEVANCE_EVAL_MAX_QUEUE = int(os.getenv('RELEVANCE_EVAL_MAX_QUEUE', '256'))
+    RELEVANCE_EVAL_BATCH_SIZE = int(os.getenv('RELEVANCE_EVAL_BATCH_SIZE', '8'))
+    RELEVANCE_EVAL_MAX_WAIT_MS = float(os.getenv('RELEVANCE_EVAL_MAX_WAIT_MS', '200'))
+    RELEVANCE_EVAL_ENQUEUE_TIMEOUT = float(os.getenv('RELEVANCE_EVAL_ENQUEUE_TIMEOUT', '0.05'))
+    
+    # Semantic /question answer cache (cosine similarity threshold on question embeddings; set ANSWER_CACHE_DB to persist)
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '512'))
+    ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '86400'))
+    ANSWER_CACHE_DB = os.getenv('ANSWER_CACHE_DB', '')
+    
+    # Exact-match embedding cache (set EMBEDDING_CACHE_DB to share vectors across workers and restarts)
+    EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '2048'))
+    EMBEDDING_CACHE_DB = os.getenv('EMBEDDING_CACHE_DB', '')
+    EMBEDDING_CACHE_PREWARM = os.getenv('EMBEDDING_CACHE_PREWARM', 'true').lower() == 'true'
+    
+    # Precomputed diagnosis retrieval context per acne type and type combination
+    DIAGNOSIS_CONTEXT_PRECOMPUTE = os.getenv('DIAGNOSIS_CONTEXT_PRECOMPUTE', 'true').lower() == 'true'
+    DIAGNOSIS_CONTEXT_CHECK_INTERVAL = int(os.getenv('DIAGNOSIS_CONTEXT_CHECK_INTERVAL', '300'))
+    DIAGNOSIS_CONTEXT_CACHE_PATH = os.getenv('DIAGNOSIS_CONTEXT_CACHE_PATH', 'instance/diagnosis_context.json')
+    # Largest label combination precomputed (0 precomputes all 2^n - 1; larger detections use live retrieval)
+    DIAGNOSIS_CONTEXT_MAX_COMBINATION = int(os.getenv('DIAGNOSIS_CONTEXT_MAX_COMBINATION', '3'))
+    
+    # Threads per worker running knowledge base retrievals concurrently (1 runs them serially)
+    RETRIEVAL_MAX_WORKERS = int(os.getenv('RETRIEVAL_MAX_WORKERS', '8'))
+    
+    # Coalesce identical concurrent /question and diagnosis LLM calls (set SINGLE_FLIGHT_LOCK_DIR,
+    # e.g. /dev/shm/acne-sense-flights, to coalesce across workers too)
+    SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', '60'))
+    SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR', '')
+    
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', 'service-account-key.json')
     
     # Qdrant configuration
     QDRANT_URL = os.getenv('QDRANT_URL', 'http://localhost:6333')
     QDRANT_API_KEY = os.getenv('QDRANT_API_KEY')
     QDRANT_COLLECTION_NAME = os.getenv('QDRANT_COLLECTION_NAME', 'acne_knowledge_base')
+    QDRANT_TIMEOUT = int(os.getenv('QDRANT_TIMEOUT', '10'))
+    
+    # Retrieval backend: qdrant, local (in-process TF-IDF index over the CSVs) or auto (Qdrant, local fallback)
+    RETRIEVER_BACKEND = os.getenv('RETRIEVER_BACKEND', 'auto')
     VERTEX_AI_EMBEDDING_MODEL = os.getenv('VERTEX_AI_EMBEDDING_MODEL', 'text-embedding-004')
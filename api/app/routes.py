@@ -1,24 +1,283 @@
 import uuid
 import time
 import traceback
-import os
-import shutil
 import json  
-from werkzeug.utils import secure_filename
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context, g
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from app.services.rag_service import rag, process_diagnosis
+from app.services.rag_service import rag, rag_stream, generate_diagnosis, diagnosis_fallback, stream_diagnosis, embedding_cache_metrics, llm_call_metrics
 from app.services.db_service import save_conversation, save_feedback
-from app.services.diagnosis_service import DiagnosisPipeline
 from app.services.translation_service import TranslationService
+from app.services.diagnosis_service import decode_image, render_annotated_image, IMAGE_MODES, OUTPUT_FORMATS
+from app.utils.inference_scheduler import InferenceUnavailableError
+from app.utils.single_flight import flight_key
+from app.utils.deadline import start_deadline, reset_deadline, remaining
+from app.utils.image_upload import ImageUploadError, ImageTooLargeError, read_image_stream, parse_json_image_stream
 
 api_bp = Blueprint('api', __name__)
 
+# Latency budget (config key) of each endpoint; retrieval, generation and evaluation stages share it
+ENDPOINT_DEADLINES = {
+    "api.handle_question": "QUESTION_DEADLINE",
+    "api.diagnosis": "DIAGNOSIS_DEADLINE",
+    "api.combined_diagnosis": "COMBINED_DIAGNOSIS_DEADLINE"
+}
+
+@api_bp.before_request
+def _start_request_deadline():
+    """Start the endpoint's latency budget, shortened by an X-Deadline-Ms header when the caller has less time"""
+    config_key = ENDPOINT_DEADLINES.get(request.endpoint)
+    if config_key is None:
+        return
+    budget = current_app.config[config_key]
+    requested = _client_deadline()
+    if requested is not None:
+        budget = min(budget, requested)
+    g.deadline_token = start_deadline(budget)
+
+@api_bp.teardown_request
+def _end_request_deadline(error=None):
+    token = g.pop("deadline_token", None)
+    if token is not None:
+        reset_deadline(token)
+
+def _client_deadline():
+    """Budget in seconds requested with X-Deadline-Ms (never below MIN_CLIENT_DEADLINE), or None without a valid header"""
+    try:
+        requested = float(request.headers.get('X-Deadline-Ms', '')) / 1000
+    except ValueError:
+        return None
+    return max(current_app.config['MIN_CLIENT_DEADLINE'], requested)
+
+def _request_deadline():
+    """Inference queue deadline in seconds: X-Deadline-Ms and the request's remaining budget, capped by the configured deadline"""
+    default_deadline = current_app.config['INFERENCE_DEADLINE']
+    requested = _client_deadline()
+    if requested is None:
+        requested = default_deadline
+    return max(0.0, min(requested, default_deadline, remaining(default_deadline)))
+
+def _check_content_length():
+    """Reject bodies that declare a size over the limit before reading any of them"""
+    if request.content_length and request.content_length > current_app.config['MAX_CONTENT_LENGTH']:
+        raise ImageTooLargeError("Request body is too large")
+
+def _read_uploaded_image(file):
+    """Read a multipart upload straight into a decode buffer with size limit and header sniffing"""
+    return read_image_stream(file.stream, current_app.config['MAX_IMAGE_BYTES'])
+
+def _read_json_image():
+    """Stream a JSON body, decoding its base64 "image" incrementally; returns (fields, image_data)"""
+    return parse_json_image_stream(request.stream, current_app.config['MAX_IMAGE_BYTES'])
+
+def _upload_error_response(error):
+    """JSON error for a rejected image upload (400, 413 or 415)"""
+    status_code = getattr(error, 'status_code', None) or getattr(error, 'code', 400)
+    return jsonify({"error": str(error)}), status_code
+
+def _render_options(params):
+    """Result image options (output, images, jpeg_quality, max_dimension) from request parameters or config defaults"""
+    image_mode = params.get('images') or current_app.config['DIAGNOSIS_IMAGE_MODE']
+    if image_mode not in IMAGE_MODES:
+        raise ValueError(f"images must be one of {', '.join(IMAGE_MODES)}")
+    
+    output_format = params.get('output') or "images"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output must be one of {', '.join(OUTPUT_FORMATS)}")
+    
+    try:
+        jpeg_quality = int(params.get('jpeg_quality') or current_app.config['DIAGNOSIS_JPEG_QUALITY'])
+        max_dimension = int(params.get('max_dimension') or current_app.config['DIAGNOSIS_MAX_IMAGE_DIMENSION'] or 0)
+    except (TypeError, ValueError):
+        raise ValueError("jpeg_quality and max_dimension must be integers")
+    
+    return {
+        "output_format": output_format,
+        "image_mode": image_mode,
+        "jpeg_quality": max(1, min(jpeg_quality, 100)),
+        "max_dimension": max_dimension if max_dimension > 0 else None
+    }
+
+def _run_diagnosis_pipeline(image_data, render_options):
+    """Run the image pipeline on a pooled pipeline once the inference scheduler admits the request"""
+    max_working_resolution = current_app.config['DIAGNOSIS_MAX_WORKING_RESOLUTION']
+    
+    # The upload bytes key the result cache, so a hit costs a hash and no decode
+    cache = current_app.diagnosis_cache
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key_for(image_data, {**render_options, "max_working_resolution": max_working_resolution})
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cached["metadata"]["cached"] = True
+            return cached
+    
+    with current_app.inference_scheduler.slot(deadline=_request_deadline()):
+        # Decode inside the slot so queued requests hold compressed bytes, not full-size pixel arrays
+        img = decode_image(image_data, max_working_resolution)
+        with current_app.diagnosis_pool.pipeline() as pipeline:
+            results = pipeline.process(img, **render_options)
+    
+    if cache is not None:
+        cache.set(cache_key, results)
+    return results
+
+def _coalesced(key_parts, fn, shareable=None):
+    """Run fn once for concurrent identical requests (key_parts identify the request, see SingleFlight.do)"""
+    single_flight = current_app.single_flight
+    if single_flight is None:
+        return fn()
+    return single_flight.do(flight_key(*key_parts), fn, timeout=remaining(), shareable=shareable)
+
+def _recommendations(acne_types, user_info, target_language, model, thinking_budget=None):
+    """Recommendation sections, shared by identical concurrent requests (each falls back on its own error)"""
+    try:
+        return _coalesced(
+            ("diagnosis", acne_types, user_info, target_language, model, thinking_budget),
+            lambda: generate_diagnosis(
+                acne_types,
+                user_info,
+                target_language=target_language,
+                thinking_budget=thinking_budget
+            )
+        )
+    except Exception as e:
+        return diagnosis_fallback(e)
+
+def _inference_unavailable_response(error):
+    """Fast 503 telling the client when to retry"""
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @api_bp.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "ok", "time": time.time()})
 
+@api_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Inference queue metrics of the worker serving this request"""
+    cache = current_app.diagnosis_cache
+    evaluation_queue = current_app.evaluation_queue
+    answer_cache = current_app.answer_cache
+    single_flight = current_app.single_flight
+    return jsonify({
+        "llm": llm_call_metrics(),
+        "single_flight": single_flight.metrics() if single_flight is not None else None,
+        "embedding_cache": embedding_cache_metrics(),
+        "answer_cache": answer_cache.metrics() if answer_cache is not None else None,
+        "inference": current_app.inference_scheduler.metrics(),
+        "diagnosis_cache": cache.metrics() if cache is not None else None,
+        "relevance_evaluation": evaluation_queue.metrics() if evaluation_queue is not None else None,
+        "time": time.time()
+    })
+
+def _wants_stream(data):
+    """Stream the response as Server-Sent Events when asked through "stream": true or the Accept header"""
+    return data.get("stream") is True or "text/event-stream" in request.headers.get("Accept", "")
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events):
+    """Response streaming a generator of SSE strings (runs in the request context, unbuffered by proxies)"""
+    response = Response(stream_with_context(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+def _lookup_cached_answer(question, target_language, model, bypass_cache):
+    """Return (answer_data or None, question embedding or None) from the semantic answer cache"""
+    answer_cache = current_app.answer_cache
+    if answer_cache is None:
+        return None, None
+    
+    t0 = time.time()
+    question_vector = answer_cache.embed(question)
+    if question_vector is None or bypass_cache:
+        return None, question_vector
+    
+    answer_data, similarity = answer_cache.lookup(question_vector, target_language, model)
+    if answer_data is not None:
+        answer_data["response_time"] = time.time() - t0
+        answer_data["relevance"] = "CACHED"
+        answer_data["relevance_explanation"] = f"Answer reused from a similar question (similarity {similarity:.3f})"
+    return answer_data, question_vector
+
+def _remember_answer(question_vector, question, target_language, model, answer_data):
+    # Remember real, evaluated answers only (rag flags error answers as degraded)
+    if (question_vector is not None
+            and not answer_data.get("degraded")
+            and answer_data.get("relevance") not in ("PENDING", "NON_RELEVANT")):
+        current_app.answer_cache.store(question_vector, question, target_language, model, answer_data)
+
+def _finish_question(conversation_id, question, answer_data, cached, question_vector=None, target_language="en", model=None):
+    """Save the conversation, queue its evaluation, cache the answer once judged and build the /question response body"""
+    # Save conversation to database
+    save_conversation(
+        conversation_id=conversation_id,
+        question=question,
+        answer_data=answer_data
+    )
+    
+    evaluation_queue = current_app.evaluation_queue
+    if not cached and evaluation_queue is None:
+        # Relevance was evaluated inline
+        _remember_answer(question_vector, question, target_language, model, answer_data)
+    elif not cached:
+        def remember(evaluation):
+            # Runs on the evaluation worker once the verdict is in
+            evaluated = dict(
+                answer_data,
+                relevance=evaluation.get("Relevance", "UNKNOWN"),
+                relevance_explanation=evaluation.get("Explanation", "Failed to parse evaluation")
+            )
+            _remember_answer(question_vector, question, target_language, model, evaluated)
+        
+        # Queue the evaluation once the row exists so the worker can update it
+        evaluation_queue.submit(conversation_id, question, answer_data["answer"], on_evaluated=remember)
+    
+    # Format result with language information
+    return {
+        "conversation_id": conversation_id,
+        "question": question,
+        "answer": answer_data["answer"],
+        "original_language": answer_data.get("original_language", "en"),
+        "target_language": answer_data.get("target_language", "en"),
+        "cached": cached
+    }
+
+def _stream_question(conversation_id, question, target_language, model, answer_data, question_vector):
+    """SSE events for /question: meta, token*, then done with the regular response body (or error)"""
+    try:
+        yield _sse_event("meta", {"conversation_id": conversation_id, "target_language": target_language})
+        
+        cached = answer_data is not None
+        if cached:
+            yield _sse_event("token", {"text": answer_data["answer"]})
+        else:
+            for kind, payload in rag_stream(
+                question,
+                target_language=target_language,
+                model=model,
+                thinking_budget=256,  # Allow some thinking for question answering
+                evaluate=current_app.evaluation_queue is None
+            ):
+                if kind == "token":
+                    yield _sse_event("token", {"text": payload})
+                else:
+                    answer_data = payload
+        
+        yield _sse_event("done", _finish_question(
+            conversation_id, question, answer_data, cached, question_vector, target_language, model
+        ))
+    
+    except Exception as e:
+        traceback.print_exc()
+        yield _sse_event("error", {"error": str(e)})
+
 @api_bp.route("/question", methods=["POST"])
 def handle_question():
     """Answer a question using RAG with multilingual support"""
@@ -36,32 +295,34 @@ def handle_question():
         # Generate a unique conversation ID
         conversation_id = str(uuid.uuid4())
         
-        # Use multilingual RAG with specified parameters and thinking budget for questions
-        answer_data = rag(
-            query=question,
-            target_language=target_language,
-            translation_method=translation_method,
-            model=model,
-            thinking_budget=256  # Allow some thinking for question answering
-        )
+        # Look for an answer to a semantically similar question (bypass_cache or Cache-Control: no-cache skips the lookup)
+        bypass_cache = bool(data.get("bypass_cache", False)) or "no-cache" in request.headers.get("Cache-Control", "")
+        answer_data, question_vector = _lookup_cached_answer(question, target_language, model, bypass_cache)
         
-        # Format result with language information
-        result = {
-            "conversation_id": conversation_id,
-            "question": question,
-            "answer": answer_data["answer"],
-            "original_language": answer_data.get("original_language", "en"),
-            "target_language": answer_data.get("target_language", "en")
-        }
+        if _wants_stream(data):
+            return _sse_response(_stream_question(conversation_id, question, target_language, model, answer_data, question_vector))
         
-        # Save conversation to database
-        save_conversation(
-            conversation_id=conversation_id,
-            question=question,
-            answer_data=answer_data
-        )
+        cached = answer_data is not None
+        if not cached:
+            # Use multilingual RAG with specified parameters and thinking budget for questions
+            # (relevance is evaluated in the background when the queue is enabled)
+            # Identical questions in flight at the same time share one answer
+            evaluate = current_app.evaluation_queue is None
+            answer_data = _coalesced(
+                ("question", question, target_language, model, evaluate),
+                lambda: rag(
+                    query=question,
+                    target_language=target_language,
+                    translation_method=translation_method,
+                    model=model,
+                    thinking_budget=256,  # Allow some thinking for question answering
+                    evaluate=evaluate
+                ),
+                # Error answers stay with the request that produced them, the others retry
+                shareable=lambda result: not result.get("degraded")
+            )
         
-        return jsonify(result)
+        return jsonify(_finish_question(conversation_id, question, answer_data, cached, question_vector, target_language, model))
     
     except Exception as e:
         traceback.print_exc()
@@ -92,6 +353,26 @@ def handle_feedback():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def _stream_diagnosis(acne_types, user_info, target_language):
+    """SSE events for /diagnosis: token* interleaved with section as each completes, then done (or error)"""
+    try:
+        for kind, payload in stream_diagnosis(acne_types, user_info, target_language=target_language):
+            if kind == "token":
+                yield _sse_event("token", {"text": payload})
+            elif kind == "section":
+                yield _sse_event("section", payload)
+            else:
+                yield _sse_event("done", {
+                    "recommendation_sections": payload,
+                    "format": "structured",
+                    "target_language": target_language,
+                    "translation_method": "integrated_llm"
+                })
+    
+    except Exception as e:
+        traceback.print_exc()
+        yield _sse_event("error", {"error": str(e)})
+
 @api_bp.route("/diagnosis", methods=["POST"])
 def diagnosis():
     """Process a diagnosis based on acne types and user info with multilingual support"""
@@ -108,13 +389,11 @@ def diagnosis():
         if not acne_types:
             return jsonify({"error": "No acne types provided"}), 400
         
+        if _wants_stream(data):
+            return _sse_response(_stream_diagnosis(acne_types, user_info, target_language))
+        
         # Generate recommendations directly in target language
-        recommendation_sections = process_diagnosis(
-            acne_types, 
-            user_info, 
-            target_language=target_language,
-            model=model
-        )
+        recommendation_sections = _recommendations(acne_types, user_info, target_language, model)
         
         # Build response
         result = {
@@ -134,6 +413,8 @@ def diagnosis():
 def image_diagnosis():
     """Process an uploaded image for acne detection and classification"""
     try:
+        _check_content_length()
+        
         # Check if image file is in request
         if 'image' not in request.files:
             return jsonify({"error": "No image provided"}), 400
@@ -141,62 +422,25 @@ def image_diagnosis():
         file = request.files['image']
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
-            
-        # Generate unique filename to prevent collisions
-        filename = f"{str(uuid.uuid4())}.jpg"
-        upload_path = os.path.join(current_app.config['UPLOAD_DIR'], filename)
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-        
-        # Save the uploaded file
-        file.save(upload_path)
         
+        # Which result images to render, from query string or form fields
         try:
-            # Initialize and run the diagnosis pipeline
-            pipeline = DiagnosisPipeline(
-                detection_model_path=current_app.config.get('DETECTION_MODEL_PATH'),
-                classification_model_path=current_app.config.get('CLASSIFICATION_MODEL_PATH'),
-                class_index_path=current_app.config.get('CLASS_INDEX_PATH')
-            )
-            
-            # Process the image
-            results = pipeline.process(upload_path)
+            render_options = _render_options(request.values)
+        except ValueError as option_error:
+            return jsonify({"error": str(option_error)}), 400
             
-            return jsonify(results)
-            
-        finally:
-            # Clean up files after response is sent
-            try:
-                # Remove uploaded image
-                if os.path.exists(upload_path):
-                    os.remove(upload_path)
-                    print(f"Cleaned up uploaded image: {upload_path}")
-                
-                # Clean up crops and result images (we already have them as base64 in the response)
-                crop_dir = current_app.config.get('CROP_DIR', 'instance/crops')
-                results_dir = current_app.config.get('RESULTS_DIR', 'instance/results')
-                
-                # Clean crop directory
-                for crop_file in os.listdir(crop_dir):
-                    try:
-                        os.remove(os.path.join(crop_dir, crop_file))
-                    except Exception as e:
-                        print(f"Failed to remove crop file {crop_file}: {str(e)}")
-                
-                # Clean results directory
-                for result_file in os.listdir(results_dir):
-                    try:
-                        os.remove(os.path.join(results_dir, result_file))
-                    except Exception as e:
-                        print(f"Failed to remove result file {result_file}: {str(e)}")
-                
-                print("Image cleanup completed successfully")
-                
-            except Exception as cleanup_error:
-                # Log cleanup error but don't fail the request
-                print(f"Error during file cleanup: {str(cleanup_error)}")
+        # Read the upload into memory, the pipeline decodes it without touching the filesystem
+        image_data = _read_uploaded_image(file)
+        
+        # Process the image on a pooled pipeline once a slot is free
+        results = _run_diagnosis_pipeline(image_data, render_options)
         
+        return jsonify(results)
+        
+    except (ImageUploadError, RequestEntityTooLarge) as e:
+        return _upload_error_response(e)
+    except InferenceUnavailableError as e:
+        return _inference_unavailable_response(e)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -205,44 +449,32 @@ def image_diagnosis():
 def combined_diagnosis():
     """Process an uploaded image or base64 image data and provide personalized recommendations in one step"""
     try:
-        upload_path = None
+        image_data = None
         user_info = {}
         model = current_app.config['DEFAULT_MODEL']
         target_language = "en"
         translation_method = "google"
         
+        _check_content_length()
+        
         # Check if request is JSON (for base64) or form (for file upload)
         if request.is_json:
-            # Handle base64 encoded image
-            data = request.json
-            base64_image = data.get('image')
+            # Handle base64 encoded image, decoded incrementally while the body streams in
+            data, image_data = _read_json_image()
             user_info = data.get('user_info', {})
             model = data.get('model', current_app.config['DEFAULT_MODEL'])
             # Get language parameters
             target_language = data.get('target_language', 'en')
             translation_method = data.get('translation_method', 'google')
             
-            if not base64_image:
+            if not image_data:
                 return jsonify({"error": "No image data provided"}), 400
-                
-            # Generate unique filename
-            filename = f"{str(uuid.uuid4())}.jpg"
-            upload_path = os.path.join(current_app.config['UPLOAD_DIR'], filename)
-            
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(upload_path), exist_ok=True)
             
-            # Decode and save base64 image
+            # Which result images to render, from the JSON body or the query string
             try:
-                import base64
-                # Remove data URL prefix if present (e.g., "data:image/jpeg;base64,")
-                if ',' in base64_image:
-                    base64_image = base64_image.split(',', 1)[1]
-                
-                with open(upload_path, "wb") as f:
-                    f.write(base64.b64decode(base64_image))
-            except Exception as decode_error:
-                return jsonify({"error": f"Invalid base64 image data: {str(decode_error)}"}), 400
+                render_options = _render_options({**request.args.to_dict(), **data})
+            except ValueError as option_error:
+                return jsonify({"error": str(option_error)}), 400
         else:
             # Handle file upload (existing functionality)
             if 'image' not in request.files:
@@ -268,101 +500,114 @@ def combined_diagnosis():
                 target_language = request.form['target_language']
             if 'translation_method' in request.form:
                 translation_method = request.form['translation_method']
-                
-            # Generate unique filename to prevent collisions
-            filename = f"{str(uuid.uuid4())}.jpg"
-            upload_path = os.path.join(current_app.config['UPLOAD_DIR'], filename)
             
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-            
-            # Save the uploaded file
-            file.save(upload_path)
+            # Which result images to render, from query string or form fields
+            try:
+                render_options = _render_options(request.values)
+            except ValueError as option_error:
+                return jsonify({"error": str(option_error)}), 400
+                
+            # Read the upload into memory
+            image_data = _read_uploaded_image(file)
         
-        try:
-            # Initialize and run the diagnosis pipeline
-            pipeline = DiagnosisPipeline(
-                detection_model_path=current_app.config.get('DETECTION_MODEL_PATH'),
-                classification_model_path=current_app.config.get('CLASSIFICATION_MODEL_PATH'),
-                class_index_path=current_app.config.get('CLASS_INDEX_PATH')
-            )
-            
-            # Process the image
-            image_results = pipeline.process(upload_path)
-            
-            # Extract acne types from classification results
-            acne_types = []
-            for result in image_results.get("classification_results", []):
-                if result.get("class") not in acne_types:
-                    acne_types.append(result.get("class"))
-            
-            # If no acne types detected, return early with just image results but restructured
-            if not acne_types:
-                # Restructure the response (move metadata fields up)
-                metadata = image_results.pop("metadata", {})
-                restructured_results = {**image_results, **metadata}
-                restructured_results["message"] = "No acne detected to generate recommendations"
-                return jsonify(restructured_results)
-            
-            # Generate recommendations directly in target language with thinking_budget=0
-            recommendation_sections = process_diagnosis(
-                acne_types, 
-                user_info, 
-                target_language=target_language,
-                model=model, 
-                thinking_budget=0
-            )
-            
-            # Initialize translation info
-            translation_info = {
-                "target_language": target_language,
-                "translation_method": "integrated_llm"
-            }
-            
+        # Process the image on a pooled pipeline once a slot is free
+        image_results = _run_diagnosis_pipeline(image_data, render_options)
+        
+        # Extract acne types from classification results
+        acne_types = []
+        for result in image_results.get("classification_results", []):
+            if result.get("class") not in acne_types:
+                acne_types.append(result.get("class"))
+        
+        # If no acne types detected, return early with just image results but restructured
+        if not acne_types:
             # Restructure the response (move metadata fields up)
             metadata = image_results.pop("metadata", {})
+            restructured_results = {**image_results, **metadata}
+            restructured_results["message"] = "No acne detected to generate recommendations"
+            return jsonify(restructured_results)
+        
+        # Generate recommendations directly in target language with thinking_budget=0
+        recommendation_sections = _recommendations(acne_types, user_info, target_language, model, thinking_budget=0)
+        
+        # Initialize translation info
+        translation_info = {
+            "target_language": target_language,
+            "translation_method": "integrated_llm"
+        }
+        
+        # Restructure the response (move metadata fields up)
+        metadata = image_results.pop("metadata", {})
+        
+        # Combine both results into a single response
+        combined_results = {
+            **image_results,
+            **metadata,
+            **translation_info,
+            "acne_types": acne_types,
+            "recommendation_sections": recommendation_sections,
+            "format": "structured"
+        }
+        
+        return jsonify(combined_results)
+        
+    except (ImageUploadError, RequestEntityTooLarge) as e:
+        return _upload_error_response(e)
+    except InferenceUnavailableError as e:
+        return _inference_unavailable_response(e)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@api_bp.route("/render-annotation", methods=["POST"])
+def render_annotation():
+    """Render the annotated image on demand from the structured lesions of an image diagnosis"""
+    try:
+        _check_content_length()
+        
+        # Accept the same image transports as /combined-diagnosis
+        if request.is_json:
+            data, image_data = _read_json_image()
+            lesions = data.get('lesions')
+            params = {**request.args.to_dict(), **data}
             
-            # Combine both results into a single response
-            combined_results = {
-                **image_results,
-                **metadata,
-                **translation_info,
-                "acne_types": acne_types,
-                "recommendation_sections": recommendation_sections,
-                "format": "structured"
-            }
-            
-            return jsonify(combined_results)
-            
-        finally:
-            # Clean up files after response is sent
+            if not image_data:
+                return jsonify({"error": "No image data provided"}), 400
+        else:
+            if 'image' not in request.files:
+                return jsonify({"error": "No image provided"}), 400
+            image_data = _read_uploaded_image(request.files['image'])
+            params = request.values
             try:
-                # Remove uploaded image
-                if os.path.exists(upload_path):
-                    os.remove(upload_path)
-                    print(f"Cleaned up uploaded image: {upload_path}")
-                
-                # Clean up crops and result images
-                crop_dir = current_app.config.get('CROP_DIR', 'instance/crops')
-                results_dir = current_app.config.get('RESULTS_DIR', 'instance/results')
-                
-                # Clean crop directory
-                for crop_file in os.listdir(crop_dir):
-                    try:
-                        os.remove(os.path.join(crop_dir, crop_file))
-                    except Exception as e:
-                        print(f"Failed to remove crop file {crop_file}: {str(e)}")
-                
-                # Clean results directory
-                for result_file in os.listdir(results_dir):
-                    try:
-                        os.remove(os.path.join(results_dir, result_file))
-                    except Exception as e:
-                        print(f"Failed to remove result file {result_file}: {str(e)}")
-            
-            except Exception as cleanup_error:
-                print(f"Error during file cleanup: {str(cleanup_error)}")
+                lesions = json.loads(request.form.get('lesions', 'null'))
+            except ValueError:
+                return jsonify({"error": "Invalid lesions JSON format"}), 400
+        
+        if not isinstance(lesions, dict):
+            return jsonify({"error": "No lesions provided"}), 400
         
+        try:
+            render_options = _render_options(params)
+        except ValueError as option_error:
+            return jsonify({"error": str(option_error)}), 400
+        
+        # Decoding and drawing are as CPU heavy as a diagnosis, so rendering waits for the same slots
+        with current_app.inference_scheduler.slot(deadline=_request_deadline()):
+            jpeg_data = render_annotated_image(
+                image_data,
+                lesions,
+                jpeg_quality=render_options['jpeg_quality'],
+                max_dimension=render_options['max_dimension'],
+                working_dimension=current_app.config['DIAGNOSIS_MAX_WORKING_RESOLUTION']
+            )
+        return Response(jpeg_data, mimetype="image/jpeg")
+    
+    except InferenceUnavailableError as e:
+        return _inference_unavailable_response(e)
+    except (ImageUploadError, RequestEntityTooLarge) as e:
+        return _upload_error_response(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,79 @@
+import queue
+import threading
+from concurrent.futures import Future
+from app.utils.batching import collect_batch
+from app.utils.fork_safety import reset_after_fork
+
+class MicroBatchClassifier:
+    """
+    Micro-batching front for a DiagnosisClassificationService shared by all pipelines of a worker.
+    
+    Crops submitted by concurrent requests are collected for up to max_wait_ms (or until max_batch
+    crops are queued), classified with a single batched invoke, and handed back through futures.
+    It exposes the same predict_batch(crops) interface as the classifier it wraps.
+    """
+
+    def __init__(self, classifier_factory, max_batch=32, max_wait_ms=5):
+        self.classifier_factory = classifier_factory
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+
+        self.classifier = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        reset_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The batching thread does not survive a gunicorn fork and interpreters must never cross it
+        self.classifier = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Build the classifier and start the batching thread once per process"""
+        if self._thread is not None:
+            return
+
+        with self._start_lock:
+            if self._thread is not None:
+                return
+
+            self.classifier = self.classifier_factory()
+            thread = threading.Thread(target=self._run, name="classification-batcher", daemon=True)
+            thread.start()
+            self._thread = thread
+
+    @property
+    def interpreter(self):
+        """Interpreter of the wrapped classifier (used for warm-up)"""
+        self._ensure_started()
+        return self.classifier.interpreter
+
+    def submit(self, crop):
+        """Queue one BGR crop for classification and return a future of its prediction"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((crop, future))
+        return future
+
+    def predict_batch(self, crops):
+        """Classify crops together with whatever other requests queued in the same window"""
+        futures = [self.submit(crop) for crop in crops]
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            batch = collect_batch(self._queue, self.max_batch, self.max_wait)
+            crops = [crop for crop, _ in batch]
+            try:
+                predictions = self.classifier.predict_batch(crops)
+            except Exception as e:
+                print(f"Batched classification failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), prediction in zip(batch, predictions):
+                future.set_result(prediction)
@@ -31,6 +31,17 @@ def save_conversation(conversation_id, question, answer_data):
     
     return conversation_id
 
+def update_conversation_relevance(conversation_id, relevance, relevance_explanation):
+    """Write a relevance evaluation back to a saved conversation."""
+    supabase = get_supabase_client()
+    
+    supabase.table("conversations").update({
+        "relevance": relevance,
+        "relevance_explanation": relevance_explanation
+    }).eq("id", conversation_id).execute()
+    
+    return True
+
 def save_feedback(conversation_id, feedback):
     """Save user feedback to Supabase."""
     timestamp = datetime.now().isoformat()
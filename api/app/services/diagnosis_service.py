@@ -4,14 +4,26 @@ import numpy as np
 import json
 import base64
 import time
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-import tflite_runtime.interpreter as tflite
-from flask import current_app
+from app.utils.detection_postprocess import decode_yolo_output, non_max_suppression
+from app.utils.model_store import create_interpreter
+from app.utils.fork_safety import reset_after_fork
+from app.utils.image_decode import read_jpeg_header, reduced_decode_flag, apply_exif_orientation
 
 DETECT_CONFIDENCE = 0.30
 CLASSIFY_CONFIDENCE = 0.50
 ENLARGE_SCALE = 1.75
 CROP_SCALE_FACTOR = 4.5
+CLASSIFY_MAX_BATCH = 32
+
+# Which result images process() renders: nothing, only the annotated image, or also one panel per lesion
+IMAGE_MODES = ("none", "annotated_only", "all")
+# Response layout of process(): rendered images, or per-lesion boxes/classes as columnar data only
+OUTPUT_FORMATS = ("images", "structured")
 
 def enlarge_bbox(x1, y1, x2, y2, scale, img_width, img_height):
     w = x2 - x1
@@ -29,52 +41,104 @@ def enlarge_bbox(x1, y1, x2, y2, scale, img_width, img_height):
 
     return new_x1, new_y1, new_x2, new_y2
 
-def non_max_suppression(boxes, scores, iou_threshold=0.5):
-    if len(boxes) == 0:
-        return []
+def fit_within(img, max_dimension=None):
+    """Downscale an image so its longest side is at most max_dimension"""
+    if not max_dimension:
+        return img
+    height, width = img.shape[:2]
+    scale = max_dimension / max(height, width)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+# Process-wide thread pool for per-lesion crop preparation and panel encoding (OpenCV releases the GIL)
+_crop_executor = None
+_crop_executor_lock = threading.Lock()
+
+def _reset_crop_executor():
+    # Threads do not survive a gunicorn fork, each worker creates its own pool
+    global _crop_executor, _crop_executor_lock
+    _crop_executor = None
+    _crop_executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_crop_executor)
+
+def get_crop_executor(max_workers):
+    """Return this process's crop thread pool, or None when max_workers disables parallelism"""
+    global _crop_executor
+    if not max_workers or max_workers <= 1:
+        return None
     
-    boxes = np.array(boxes)
-    scores = np.array(scores)
+    with _crop_executor_lock:
+        if _crop_executor is None:
+            _crop_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="diagnosis-crops")
+    return _crop_executor
+
+def prepare_crop(img, box):
+    """Enlarge a detected box, crop it from the image and upscale it for classification"""
+    img_height, img_width = img.shape[:2]
+    x1, y1, x2, y2 = enlarge_bbox(*box, ENLARGE_SCALE, img_width, img_height)
     
-    indices = np.argsort(scores)[::-1]
+    # Crop and resize
+    crop = img[y1:y2, x1:x2]
+    resized_crop = cv2.resize(crop, None, fx=CROP_SCALE_FACTOR, fy=CROP_SCALE_FACTOR, interpolation=cv2.INTER_CUBIC)
+    return [x1, y1, x2, y2], resized_crop
+
+def _decode_image_bytes(data, max_dimension=None):
+    """Decode encoded image bytes, using reduced-resolution JPEG decoding when the image is far larger than needed"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    width, height, orientation = read_jpeg_header(data)
     
-    keep = []
-    while len(indices) > 0:
-        current = indices[0]
-        keep.append(current)
-        
-        if len(indices) == 1:
-            break
-            
-        current_box = boxes[current]
-        remaining_boxes = boxes[indices[1:]]
-        
-        x1 = np.maximum(current_box[0], remaining_boxes[:, 0])
-        y1 = np.maximum(current_box[1], remaining_boxes[:, 1])
-        x2 = np.minimum(current_box[2], remaining_boxes[:, 2])
-        y2 = np.minimum(current_box[3], remaining_boxes[:, 3])
-        
-        intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
-        
-        area_current = (current_box[2] - current_box[0]) * (current_box[3] - current_box[1])
-        area_remaining = (remaining_boxes[:, 2] - remaining_boxes[:, 0]) * (remaining_boxes[:, 3] - remaining_boxes[:, 1])
-        union = area_current + area_remaining - intersection
-        
-        iou = intersection / (union + 1e-6)
-        
-        indices = indices[1:][iou < iou_threshold]
+    if width is None:
+        # Not a JPEG (or no frame header): full decode, OpenCV handles any orientation metadata
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
     
-    return [boxes[i] for i in keep], [scores[i] for i in keep]
-
-def annotate_image_with_predictions(img, boxes, predictions, save_path):
+    # Let libjpeg scale down by 2/4/8 while decoding and apply the EXIF orientation ourselves
+    flag = reduced_decode_flag(width, height, max_dimension)
+    img = cv2.imdecode(buffer, flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        return None
+    return apply_exif_orientation(img, orientation)
+
+def decode_image(image, max_dimension=None):
+    """
+    Decode an image given as raw encoded bytes, a file path or an already decoded BGR array
+    
+    Args:
+        image: Encoded image bytes, file path or decoded BGR array
+        max_dimension: Longest side of the returned working image (None keeps the full resolution)
+    """
+    if isinstance(image, np.ndarray):
+        return fit_within(image, max_dimension)
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        img = _decode_image_bytes(image, max_dimension)
+        if img is None:
+            raise ValueError("Could not decode image data")
+        return fit_within(img, max_dimension)
+
+    with open(image, "rb") as f:
+        img = _decode_image_bytes(f.read(), max_dimension)
+    if img is None:
+        raise ValueError(f"Could not load image from {image}")
+    return fit_within(img, max_dimension)
+
+def encode_image_base64(img, quality=95, max_dimension=None):
+    """JPEG-encode a BGR image into a base64 data URL"""
+    img = fit_within(img, max_dimension)
+    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return "data:image/jpeg;base64," + base64.b64encode(buffer).decode('utf-8')
+
+def annotate_image_with_predictions(img, boxes, predictions, save_path=None):
     annotated_img = img.copy()
     font = cv2.FONT_HERSHEY_SIMPLEX
     font_scale = 0.5
     font_thickness = 2
 
-    for i, (x1, y1, x2, y2) in enumerate(boxes):
+    for i, box in enumerate(boxes):
         label = predictions.get(f"crop_{i}.jpg", None)
         if label:
+            x1, y1, x2, y2 = (int(v) for v in box)
             confidence = label["confidence"]
             if confidence < 0.5:
                 color = (153, 153, 255)
@@ -105,10 +169,11 @@ def annotate_image_with_predictions(img, boxes, predictions, save_path):
                 annotated_img, text, (text_x, text_y), font, font_scale, color, font_thickness, lineType=cv2.LINE_AA
             )
 
-    cv2.imwrite(save_path, annotated_img)
+    if save_path:
+        cv2.imwrite(save_path, annotated_img)
     return annotated_img
 
-def create_classification_image(crop_img, class_name, confidence, save_path):
+def create_classification_image(crop_img, class_name, confidence, save_path=None):
     pad = 5
     crop_img_padded = cv2.copyMakeBorder(crop_img, pad, pad, pad, pad, borderType=cv2.BORDER_CONSTANT, value=[0, 0, 0])
 
@@ -165,13 +230,14 @@ def create_classification_image(crop_img, class_name, confidence, save_path):
 
     combined_img = np.hstack((crop_bg, panel))
 
-    cv2.imwrite(save_path, combined_img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if save_path:
+        cv2.imwrite(save_path, combined_img, [cv2.IMWRITE_JPEG_QUALITY, 95])
     return combined_img
 
 class DiagnosisDetectionService:
-    def __init__(self, model_path):
+    def __init__(self, model_path, num_threads=None):
         self.model_path = model_path
-        self.interpreter = tflite.Interpreter(model_path=model_path)
+        self.interpreter = create_interpreter(model_path, num_threads=num_threads)
         self.interpreter.allocate_tensors()
 
         input_details = self.interpreter.get_input_details()
@@ -183,10 +249,8 @@ class DiagnosisDetectionService:
         self.input_size = (self.input_shape[2], self.input_shape[1])  # width, height
         
 
-    def detect(self, image_path):
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Could not load image from {image_path}")
+    def detect(self, image):
+        img = decode_image(image)
             
         original_h, original_w = img.shape[:2]
         print(f"Original image size: {original_w}x{original_h}")
@@ -201,56 +265,36 @@ class DiagnosisDetectionService:
 
         detections = output_data[0]
         
-        boxes = []
-        scores = []
-        
-        detections = detections.T
-        
-        for detection in detections:
-            x_center, y_center, width, height, confidence = detection
-            
-            if confidence < DETECT_CONFIDENCE:
-                continue
-                
-            x_center_px = x_center * original_w
-            y_center_px = y_center * original_h
-            width_px = width * original_w
-            height_px = height * original_h
-            
-            x1 = int(x_center_px - width_px / 2)
-            y1 = int(y_center_px - height_px / 2)
-            x2 = int(x_center_px + width_px / 2)
-            y2 = int(y_center_px + height_px / 2)
-            
-            x1 = max(0, min(x1, original_w))
-            y1 = max(0, min(y1, original_h))
-            x2 = max(0, min(x2, original_w))
-            y2 = max(0, min(y2, original_h))
-            
-            if x2 <= x1 or y2 <= y1:
-                continue
-                
-            boxes.append((x1, y1, x2, y2))
-            scores.append(confidence)
+        # Threshold, convert and clamp all anchors at once
+        boxes, scores = decode_yolo_output(detections, original_w, original_h, DETECT_CONFIDENCE)
 
         print(f"Found {len(boxes)} detections before NMS")
         
         # Apply Non-Maximum Suppression
-        if boxes:
+        if len(boxes):
             boxes, scores = non_max_suppression(boxes, scores, iou_threshold=0.5)
             print(f"Found {len(boxes)} detections after NMS")
 
         return boxes, img
 
 class DiagnosisClassificationService:
-    def __init__(self, model_path, class_index_path):
+    def __init__(self, model_path, class_index_path, max_batch=CLASSIFY_MAX_BATCH, num_threads=None):
         self.model_path = model_path
+        self.num_threads = num_threads
         self.class_names = self._load_class_indices(class_index_path)
         self.interpreter = self._load_model()
+        self.max_batch = max(1, int(max_batch))
 
         input_details = self.interpreter.get_input_details()
+        output_details = self.interpreter.get_output_details()
+
+        self.input_index = input_details[0]['index']
+        self.output_index = output_details[0]['index']
         self.input_shape = input_details[0]['shape']
         self.target_size = (self.input_shape[2], self.input_shape[1])
+        self.batch_size = int(self.input_shape[0])
+        # Cleared if the model refuses a resized batch dimension
+        self.supports_batching = True
 
     def _load_class_indices(self, path):
         with open(path, "r") as f:
@@ -258,64 +302,134 @@ class DiagnosisClassificationService:
         return {int(v): k for k, v in class_indices.items()}
 
     def _load_model(self):
-        interpreter = tflite.Interpreter(model_path=self.model_path)
+        interpreter = create_interpreter(self.model_path, num_threads=self.num_threads)
         interpreter.allocate_tensors()
         return interpreter
 
-    def predict(self, img_path):
-        input_details = self.interpreter.get_input_details()
-        output_details = self.interpreter.get_output_details()
-
-        # Load and preprocess image using PIL
-        with Image.open(img_path) as img:
-            img = img.resize(self.target_size)
-            # EfficientNet expects float32 input in [0, 255] range
-            img_array = np.array(img, dtype=np.float32)
-            img_array = np.expand_dims(img_array, axis=0)
+    def _set_batch_size(self, batch_size):
+        """Resize the input tensor to hold batch_size images (re-allocates only when it changes)"""
+        if batch_size == self.batch_size:
+            return
+
+        # Unknown until allocation succeeds, so a failed resize is always redone on the next call
+        self.batch_size = None
+        self.interpreter.resize_tensor_input(
+            self.input_index,
+            [batch_size, self.input_shape[1], self.input_shape[2], self.input_shape[3]]
+        )
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch_size
 
-        self.interpreter.set_tensor(input_details[0]['index'], img_array)
+    def _invoke(self, input_data):
+        self._set_batch_size(input_data.shape[0])
+        self.interpreter.set_tensor(self.input_index, input_data)
         self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
 
-        prediction = self.interpreter.get_tensor(output_details[0]['index'])[0]
+    def _to_prediction(self, prediction):
         predicted_index = np.argmax(prediction)
         return {
             "class": self.class_names[predicted_index],
             "confidence": round(float(prediction[predicted_index]), 4)
         }
 
+    def _preprocess_crop(self, crop):
+        # Crops come from OpenCV in BGR order, the model expects RGB like PIL produces
+        rgb_crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        crop_h, crop_w = rgb_crop.shape[:2]
+        shrinking = crop_w * crop_h > self.target_size[0] * self.target_size[1]
+        interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC
+        # EfficientNet expects float32 input in [0, 255] range
+        return cv2.resize(rgb_crop, self.target_size, interpolation=interpolation).astype(np.float32)
+
+    def predict(self, img_path):
+        # Load and preprocess image using PIL
+        with Image.open(img_path) as img:
+            img = img.resize(self.target_size)
+            # EfficientNet expects float32 input in [0, 255] range
+            img_array = np.array(img, dtype=np.float32)
+            img_array = np.expand_dims(img_array, axis=0)
+
+        prediction = self._invoke(img_array)[0]
+        return self._to_prediction(prediction)
+
+    def predict_batch(self, crops):
+        """Classify a list of BGR crops with one interpreter invoke per CLASSIFY_MAX_BATCH crops"""
+        predictions = []
+        for start in range(0, len(crops), self.max_batch):
+            predictions.extend(self._predict_chunk(crops[start:start + self.max_batch]))
+        return predictions
+
+    def _predict_chunk(self, crops):
+        if not crops:
+            return []
+
+        batch = np.stack([self._preprocess_crop(crop) for crop in crops])
+
+        if self.supports_batching:
+            # Pad up to the next power of two so the tensor is not re-allocated for every lesion count
+            capacity = min(self.max_batch, 1 << (len(crops) - 1).bit_length())
+            padded = np.zeros((capacity,) + batch.shape[1:], dtype=np.float32)
+            padded[:len(crops)] = batch
+            try:
+                output = self._invoke(padded)
+                return [self._to_prediction(prediction) for prediction in output[:len(crops)]]
+            except (RuntimeError, ValueError) as e:
+                print(f"Batched classification unsupported by model, falling back to single invokes: {str(e)}")
+                self.supports_batching = False
+                # The failed resize may have left the input tensor at the padded shape
+                self._set_batch_size(1)
+
+        return [self._to_prediction(self._invoke(batch[i:i + 1])[0]) for i in range(len(crops))]
+
 class DiagnosisPipeline:
-    def __init__(self, detection_model_path=None, classification_model_path=None, class_index_path=None):
+    def __init__(self, detection_model_path=None, classification_model_path=None, class_index_path=None, num_threads=None,
+                 classifier=None, max_working_dimension=None, crop_workers=None):
         # Use paths from config if not provided
         self.detection_model_path = detection_model_path or "models/detection/best.pt"
         self.classification_model_path = classification_model_path or "models/classification/efficientnet_v2.tflite"
         self.class_index_path = class_index_path or "models/classification/labels.json"
-        
-        # Get directory paths from flask config
-        self.upload_dir = current_app.config.get('UPLOAD_DIR', 'instance/uploads')
-        self.crop_dir = current_app.config.get('CROP_DIR', 'instance/crops')
-        self.results_dir = current_app.config.get('RESULTS_DIR', 'instance/results')
-        
-        # Create directories if they don't exist
-        os.makedirs(self.upload_dir, exist_ok=True)
-        os.makedirs(self.crop_dir, exist_ok=True)
-        os.makedirs(self.results_dir, exist_ok=True)
+        # Longest side of the working image detection and crops operate on
+        self.max_working_dimension = max_working_dimension
+        # Threads preparing crops and encoding panels concurrently (None or 1 runs them serially)
+        self.crop_workers = crop_workers
         
         # Initialize services
-        self.detector = DiagnosisDetectionService(self.detection_model_path)
-        self.classifier = DiagnosisClassificationService(self.classification_model_path, self.class_index_path)
+        self.detector = DiagnosisDetectionService(self.detection_model_path, num_threads=num_threads)
+        # A shared classifier (e.g. a MicroBatchClassifier) replaces the pipeline's own interpreter
+        self.classifier = classifier or DiagnosisClassificationService(self.classification_model_path, self.class_index_path, num_threads=num_threads)
 
-    def process(self, image_path):
+    def process(self, image, image_mode="all", jpeg_quality=95, max_dimension=None, output_format="images"):
+        """
+        Run detection and classification on encoded image bytes, a decoded BGR array or a file path
+        
+        Args:
+            image: Encoded image bytes, decoded BGR array or file path
+            image_mode: Result images to render, one of IMAGE_MODES; skipped images are never drawn or encoded
+            jpeg_quality: JPEG quality of the rendered images
+            max_dimension: Longest side of the rendered images (None keeps the full size)
+            output_format: "structured" adds a columnar "lesions" entry (boxes, enlarged crop boxes,
+                classes, confidences) and renders no images, overlays are drawn by the client
+                or by render_annotated_image
+        """
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"image_mode must be one of {', '.join(IMAGE_MODES)}")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+        structured = output_format == "structured"
+        if structured:
+            image_mode = "none"
         start_time = time.time()
         
-        # Read original image for dimensions
-        img_orig = cv2.imread(image_path)
-        img_height, img_width = img_orig.shape[:2]
+        # Decode once (downscaled to the working resolution) and pass the array between stages
+        img = decode_image(image, self.max_working_dimension)
+        img_height, img_width = img.shape[:2]
         
         # Run detection
-        detected_boxes, img = self.detector.detect(image_path)
+        detected_boxes, img = self.detector.detect(img)
 
-        if not detected_boxes:
-            return {
+        if len(detected_boxes) == 0:
+            result = {
                 "detection_result": "",
                 "classification_results": [],
                 "metadata": {
@@ -329,55 +443,61 @@ class DiagnosisPipeline:
                 },
                 "message": "No acne detected in the image"
             }
+            if structured:
+                result["lesions"] = {"boxes": [], "crop_boxes": [], "classes": [], "confidences": []}
+            return result
 
-        # Prepare response structure
-        classification_results = []
-        detection_classes = []
+        # Per-lesion stages fan out over the crop thread pool; map() keeps detection order
+        executor = get_crop_executor(self.crop_workers)
+        map_lesions = executor.map if executor else map
         
-        # Process each detected box
-        prediction_map = {}
-        for i, (x1, y1, x2, y2) in enumerate(detected_boxes):
-            # Enlarge bounding box
-            x1, y1, x2, y2 = enlarge_bbox(x1, y1, x2, y2, ENLARGE_SCALE, img_width, img_height)
-
-            # Crop and resize
-            crop = img[y1:y2, x1:x2]
-            resized_crop = cv2.resize(crop, None, fx=CROP_SCALE_FACTOR, fy=CROP_SCALE_FACTOR, interpolation=cv2.INTER_CUBIC)
-            
-            # Save cropped image
-            crop_filename = f"crop_{i}.jpg"
-            crop_path = os.path.join(self.crop_dir, crop_filename)
-            cv2.imwrite(crop_path, resized_crop)
-
-            # Classify crop
-            prediction = self.classifier.predict(crop_path)
-            prediction_map[f"crop_{i}.jpg"] = prediction
-            detection_classes.append(prediction["class"])
-            
-            # Create classification result image
-            result_filename = f"classified_{i}.jpg"
-            result_path = os.path.join(self.results_dir, result_filename)
-            classified_image = create_classification_image(resized_crop, prediction["class"], prediction["confidence"], result_path)
-            
-            # Encode the classified image as base64
-            _, buffer = cv2.imencode('.jpg', classified_image, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            base64_image = "data:image/jpeg;base64," + base64.b64encode(buffer).decode('utf-8')
-            
-            # Add to classification results
-            classification_results.append({
+        # Enlarge, crop and resize each detected box
+        prepared = list(map_lesions(lambda box: prepare_crop(img, box), detected_boxes))
+        crop_boxes = [crop_box for crop_box, _ in prepared]
+        resized_crops = [resized_crop for _, resized_crop in prepared]
+
+        # Classify all crops in a single batched invoke
+        predictions = self.classifier.predict_batch(resized_crops)
+        prediction_map = {f"crop_{i}.jpg": prediction for i, prediction in enumerate(predictions)}
+        detection_classes = [prediction["class"] for prediction in predictions]
+
+        def render_annotated():
+            # Create annotated image with all detections and encode it as base64
+            annotated_img = annotate_image_with_predictions(img, detected_boxes, prediction_map)
+            return encode_image_base64(annotated_img, jpeg_quality, max_dimension)
+
+        def render_panel(crop_and_prediction):
+            # Create classification result image and encode it as base64
+            resized_crop, prediction = crop_and_prediction
+            classified_image = create_classification_image(resized_crop, prediction["class"], prediction["confidence"])
+            return encode_image_base64(classified_image, jpeg_quality, max_dimension)
+
+        # The annotated image renders alongside the per-lesion panels
+        annotated_future = None
+        base64_annotated = ""
+        if image_mode != "none":
+            if executor:
+                annotated_future = executor.submit(render_annotated)
+            else:
+                base64_annotated = render_annotated()
+
+        panels = [None] * len(predictions)
+        if image_mode == "all":
+            panels = list(map_lesions(render_panel, zip(resized_crops, predictions)))
+
+        if annotated_future is not None:
+            base64_annotated = annotated_future.result()
+
+        # Add to classification results
+        classification_results = []
+        for prediction, panel in zip(predictions, panels):
+            classification_result = {
                 "class": prediction["class"],
-                "confidence": prediction["confidence"],
-                "image": base64_image
-            })
-
-        # Create annotated image with all detections
-        annotated_filename = "annotated_image.jpg"
-        annotated_path = os.path.join(self.results_dir, annotated_filename)
-        annotated_img = annotate_image_with_predictions(img, detected_boxes, prediction_map, annotated_path)
-        
-        # Encode the annotated image as base64
-        _, buffer = cv2.imencode('.jpg', annotated_img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        base64_annotated = "data:image/jpeg;base64," + base64.b64encode(buffer).decode('utf-8')
+                "confidence": prediction["confidence"]
+            }
+            if panel is not None:
+                classification_result["image"] = panel
+            classification_results.append(classification_result)
         
         # Calculate processing time
         processing_time = round((time.time() - start_time) * 1000, 1)
@@ -396,9 +516,117 @@ class DiagnosisPipeline:
                 }
             }
         }
+        
+        if structured:
+            result["lesions"] = {
+                "boxes": [[int(v) for v in box] for box in detected_boxes],
+                "crop_boxes": crop_boxes,
+                "classes": detection_classes,
+                "confidences": [prediction["confidence"] for prediction in predictions]
+            }
 
         return result
 
+def render_annotated_image(image, lesions, jpeg_quality=95, max_dimension=None, working_dimension=None):
+    """
+    Render the annotated image from the structured "lesions" output of DiagnosisPipeline.process
+    
+    working_dimension must match the pipeline's max_working_dimension so the boxes line up.
+    
+    Returns:
+        JPEG-encoded bytes of the image with every lesion box and class drawn on it
+    """
+    img = decode_image(image, working_dimension)
+    boxes = lesions.get("boxes", [])
+    classes = lesions.get("classes", [])
+    confidences = lesions.get("confidences", [])
+    if not (len(boxes) == len(classes) == len(confidences)):
+        raise ValueError("lesions boxes, classes and confidences must have the same length")
+    
+    predictions = {
+        f"crop_{i}.jpg": {"class": class_name, "confidence": float(confidence)}
+        for i, (class_name, confidence) in enumerate(zip(classes, confidences))
+    }
+    annotated_img = fit_within(annotate_image_with_predictions(img, boxes, predictions), max_dimension)
+    
+    _, buffer = cv2.imencode('.jpg', annotated_img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return buffer.tobytes()
+
+class DiagnosisPipelinePool:
+    """Per-worker pool of pre-allocated diagnosis pipelines with checkout/checkin semantics"""
+
+    def __init__(self, size=1, detection_model_path=None, classification_model_path=None, class_index_path=None,
+                 checkout_timeout=None, num_threads=None, classifier=None, max_working_dimension=None, crop_workers=None):
+        self.size = max(1, int(size))
+        self.detection_model_path = detection_model_path
+        self.classification_model_path = classification_model_path
+        self.class_index_path = class_index_path
+        self.checkout_timeout = checkout_timeout
+        self.num_threads = num_threads
+        self.classifier = classifier
+        self.max_working_dimension = max_working_dimension
+        self.crop_workers = crop_workers
+
+        self.pipelines = []
+        # LIFO so the most recently used (cache-warm) interpreters are handed out first
+        self._available = queue.LifoQueue(maxsize=self.size)
+        self._fill_lock = threading.Lock()
+        reset_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Interpreters must never cross a fork, each worker builds its own
+        self.pipelines = []
+        self._available = queue.LifoQueue(maxsize=self.size)
+        self._fill_lock = threading.Lock()
+
+    def fill(self):
+        """Construct every pipeline of the pool (loads the models and allocates tensors once per process)"""
+        with self._fill_lock:
+            if self.pipelines:
+                return self.pipelines
+
+            pipelines = [
+                DiagnosisPipeline(
+                    detection_model_path=self.detection_model_path,
+                    classification_model_path=self.classification_model_path,
+                    class_index_path=self.class_index_path,
+                    num_threads=self.num_threads,
+                    classifier=self.classifier,
+                    max_working_dimension=self.max_working_dimension,
+                    crop_workers=self.crop_workers
+                )
+                for _ in range(self.size)
+            ]
+            for pipeline in pipelines:
+                self._available.put(pipeline)
+            self.pipelines = pipelines
+            print(f"Diagnosis pipeline pool ready with {self.size} pipeline(s)")
+            return self.pipelines
+
+    def checkout(self, timeout=None):
+        """Take a pipeline out of the pool, blocking until one is free"""
+        if not self.pipelines:
+            self.fill()
+
+        timeout = self.checkout_timeout if timeout is None else timeout
+        try:
+            return self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No diagnosis pipeline available after {timeout} seconds")
+
+    def checkin(self, pipeline):
+        """Return a pipeline to the pool"""
+        self._available.put(pipeline)
+
+    @contextmanager
+    def pipeline(self, timeout=None):
+        """Context manager wrapping checkout/checkin"""
+        pipeline = self.checkout(timeout=timeout)
+        try:
+            yield pipeline
+        finally:
+            self.checkin(pipeline)
+
 def image_to_base64(image_path):
     """Utility function to convert an image file to base64 string"""
     with open(image_path, "rb") as img_file:
@@ -0,0 +1,109 @@
+import queue
+import threading
+from app.utils.batching import collect_batch
+from app.utils.fork_safety import reset_after_fork
+
+class RelevanceEvaluationQueue:
+    """
+    Background relevance evaluation for answered questions.
+
+    /question returns as soon as the answer is ready and queues (conversation_id, question, answer).
+    Worker threads collect up to batch_size jobs (waiting at most max_wait_ms for more), evaluate them
+    with one batched chain call, write each verdict back to its conversation row and pass it to the
+    job's on_evaluated callback (run inside an app context). The queue is bounded: when it stays full
+    for enqueue_timeout seconds the job is dropped and the row keeps its PENDING relevance. Jobs still
+    queued when a worker process exits are lost.
+    """
+
+    def __init__(self, app, workers=1, max_queue=256, batch_size=8, max_wait_ms=200, enqueue_timeout=0.05):
+        self.app = app
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.enqueue_timeout = max(0.0, float(enqueue_timeout))
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "dropped": 0, "evaluated": 0, "failed": 0}
+        reset_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Threads do not survive a gunicorn fork, and jobs queued in the parent belong to the parent
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the evaluation threads once per process"""
+        if self._threads:
+            return
+
+        with self._start_lock:
+            if self._threads:
+                return
+
+            threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"relevance-evaluator-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+            self._threads = threads
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def submit(self, conversation_id, question, answer, on_evaluated=None):
+        """Queue an evaluation; returns False when the queue is full and the job was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put((conversation_id, question, answer, on_evaluated), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count("dropped")
+            self.app.logger.warning(f"Relevance evaluation queue full, skipping conversation {conversation_id}")
+            return False
+
+        self._count("queued")
+        return True
+
+    def metrics(self):
+        """Snapshot of queue depth and evaluation counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["depth"] = self._queue.qsize()
+        stats["max_queue"] = self.max_queue
+        return stats
+
+    def _run(self):
+        from app.services.rag_service import evaluate_relevance_batch
+        from app.services.db_service import update_conversation_relevance
+
+        while True:
+            batch = collect_batch(self._queue, self.batch_size, self.max_wait)
+            with self.app.app_context():
+                results = evaluate_relevance_batch(
+                    [{"question": question, "answer": answer} for _, question, answer, _ in batch],
+                    max_concurrency=self.batch_size
+                )
+
+                for (conversation_id, _, _, on_evaluated), result in zip(batch, results):
+                    try:
+                        update_conversation_relevance(
+                            conversation_id,
+                            result.get("Relevance", "UNKNOWN"),
+                            result.get("Explanation", "Failed to parse evaluation")
+                        )
+                        self._count("evaluated")
+                    except Exception as e:
+                        self._count("failed")
+                        self.app.logger.error(f"Error saving relevance for conversation {conversation_id}: {str(e)}")
+
+                    if on_evaluated is not None:
+                        try:
+                            on_evaluated(result)
+                        except Exception as e:
+                            self.app.logger.error(f"Error handling relevance of conversation {conversation_id}: {str(e)}")
@@ -0,0 +1,77 @@
+import threading
+from typing import Any, Dict, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from qdrant_client.http.models import Filter
+from app.utils.index_loader import load_index
+
+# Character n-grams match plural labels ("Papules") against singular CSV rows ("Papule")
+LOCAL_INDEX_VECTORIZER_PARAMS = {"analyzer": "char_wb", "ngram_range": (3, 5), "sublinear_tf": True}
+
+# Fields never rendered into page content
+_METADATA_FIELDS = ("source",)
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+def get_local_index(app):
+    """Build the in-process TF-IDF index over the knowledge base CSVs once per process"""
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            _local_index = load_index(app, vectorizer_params=LOCAL_INDEX_VECTORIZER_PARAMS)
+    return _local_index
+
+def filter_to_dict(search_filter) -> Dict[str, Any]:
+    """
+    Metadata filter as a plain {field: value} dict.
+    
+    Accepts either a dict or the Qdrant Filter built by rag_service.retrieval_config (must conditions
+    on "metadata.<field>" with MatchValue), so both backends share one retrieval config.
+    """
+    if not search_filter:
+        return {}
+    if isinstance(search_filter, dict):
+        return dict(search_filter)
+    if isinstance(search_filter, Filter):
+        filter_dict = {}
+        for condition in search_filter.must or []:
+            key = condition.key[len("metadata."):] if condition.key.startswith("metadata.") else condition.key
+            filter_dict[key] = condition.match.value
+        return filter_dict
+    raise ValueError(f"Unsupported filter for the local retriever: {search_filter!r}")
+
+def document_from_record(record: Dict[str, Any]) -> Document:
+    """Render a knowledge base row as "Field: value" lines with its source as metadata"""
+    lines = [
+        f"{field}: {value}" for field, value in record.items()
+        if field not in _METADATA_FIELDS and str(value).strip()
+    ]
+    return Document(page_content="\n".join(lines), metadata={"source": record.get("source")})
+
+class LocalIndexRetriever(BaseRetriever):
+    """
+    Retriever over search_service.Index, a drop-in for the Qdrant vector store retriever.
+    
+    search_kwargs takes the same "k" and "filter" keys (filters on the index keyword fields, e.g.
+    {"source": "acne_types"}), so it can be made configurable and used as a fallback with one config.
+    Filtering on a field that is not a keyword field of the index raises ValueError.
+    """
+    
+    index: Any
+    search_kwargs: Dict[str, Any] = {"k": 5}
+    
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        filter_dict = filter_to_dict(self.search_kwargs.get("filter"))
+        # Index.search silently ignores fields it does not index, which would return unfiltered results
+        unknown_fields = sorted(set(filter_dict) - set(self.index.keyword_fields))
+        if unknown_fields:
+            raise ValueError(f"Local retriever cannot filter on {', '.join(unknown_fields)} (keyword fields: {', '.join(self.index.keyword_fields)})")
+        
+        records = self.index.search(query, filter_dict=filter_dict, num_results=self.search_kwargs.get("k", 5))
+        # The index only scales scores by the filter mask, so check every result against the filter itself
+        return [
+            document_from_record(record) for record in records
+            if all(record.get(field) == value for field, value in filter_dict.items())
+        ]
@@ -1,7 +1,12 @@
 import json
 import time
 import re
-from typing import Dict, List, Any, Optional
+import os
+import hashlib
+import threading
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Any, Optional, Iterator, Tuple
 from operator import itemgetter
 from flask import current_app
 from qdrant_client import QdrantClient
@@ -10,9 +15,14 @@ from langchain_google_vertexai import VertexAIEmbeddings, ChatVertexAI
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, ConfigurableField
 from langchain_qdrant import QdrantVectorStore
 from app.services.translation_service import TranslationService
+from app.services.local_retriever import LocalIndexRetriever, get_local_index
+from app.utils.embedding_cache import CachedEmbeddings
+from app.utils.deadline import DeadlineExceededError, bounded, check_deadline
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.utils.hedging import LatencyTracker, call_hedged
 
 # Improved QA Template with better instructions
 QA_TEMPLATE = """You are an expert dermatology assistant for the Acne Sense app. Your primary goal is to provide accurate, compassionate, and helpful answers to user questions about acne.
@@ -105,29 +115,104 @@ and provide your evaluation in parsable JSON without using code blocks:
 }}
 """
 
+# Prompt templates are parsed once at import
+QA_PROMPT = ChatPromptTemplate.from_template(QA_TEMPLATE)
+DIAGNOSIS_PROMPT = ChatPromptTemplate.from_template(DIAGNOSIS_TEMPLATE)
+EVALUATION_PROMPT = ChatPromptTemplate.from_template(EVALUATION_TEMPLATE)
+
+# Markdown headings of the diagnosis response, in order, with their section keys
+DIAGNOSIS_SECTIONS = [
+    ("## OVERVIEW", "overview"),
+    ("## RECOMMENDATIONS", "recommendations"),
+    ("## SKINCARE TIPS", "skincare_tips"),
+    ("## IMPORTANT NOTES", "important_notes")
+]
+
 # Global variables for initialized components
 _embeddings = None
 _vector_store = None
-_llm = None
+
+# ChatVertexAI clients keyed by generation settings, built once per worker process
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+
+# LCEL chains keyed by name and thinking budget, built once per worker process
+_chains = {}
+_chains_lock = threading.Lock()
+_configurable_retriever = None
+# With RETRIEVER_BACKEND=auto and Qdrant down: monotonic time of the next connection attempt
+_qdrant_retry_at = 0.0
+QDRANT_RETRY_INTERVAL = 60
+
+# Process-wide thread pools (knowledge base retrievals, deadline-bounded LLM calls) by name
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _reset_after_fork():
+    # Clients (and their connections), chains and threads are never shared across a gunicorn fork
+    global _llm_clients, _llm_clients_lock, _chains, _chains_lock, _executors, _executors_lock
+    _llm_clients, _llm_clients_lock = {}, threading.Lock()
+    _chains, _chains_lock = {}, threading.Lock()
+    _executors, _executors_lock = {}, threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Gemini failure tracking and call latencies (for hedging) of this worker
+_llm_breaker = None
+_llm_latency = LatencyTracker()
 
 def get_embeddings():
-    """Get or initialize Vertex AI embeddings"""
+    """Get or initialize Vertex AI embeddings (behind an exact-match cache when enabled)"""
     global _embeddings
     if _embeddings is None:
-        _embeddings = VertexAIEmbeddings(
+        embeddings = VertexAIEmbeddings(
             model_name=current_app.config['VERTEX_AI_EMBEDDING_MODEL'],
             project=current_app.config['PROJECT_ID'],
             location=current_app.config['GEMINI_LOCATION']
         )
+        if current_app.config['EMBEDDING_CACHE_ENABLED']:
+            embeddings = CachedEmbeddings(
+                embeddings,
+                model_name=current_app.config['VERTEX_AI_EMBEDDING_MODEL'],
+                max_entries=current_app.config['EMBEDDING_CACHE_MAX_ENTRIES'],
+                db_path=current_app.config['EMBEDDING_CACHE_DB']
+            )
+        _embeddings = embeddings
     return _embeddings
 
+def embedding_cache_metrics() -> Optional[Dict[str, Any]]:
+    """Embedding cache counters of this worker (None until embeddings are built or when caching is off)"""
+    if isinstance(_embeddings, CachedEmbeddings):
+        return _embeddings.metrics()
+    return None
+
+def prewarm_label_embeddings() -> bool:
+    """Embed every classifier label so process_diagnosis retrievals start from cached query vectors"""
+    if current_app.config['RETRIEVER_BACKEND'] == "local":
+        # The local index does not use embeddings
+        return False
+    try:
+        with open(current_app.config['CLASS_INDEX_PATH'], "r") as f:
+            labels = list(json.load(f))
+        
+        embeddings = get_embeddings()
+        for label in labels:
+            embeddings.embed_query(label)
+        
+        current_app.logger.info(f"Prewarmed embeddings for {len(labels)} acne type labels")
+        return True
+    except Exception as e:
+        current_app.logger.error(f"Error prewarming label embeddings: {str(e)}")
+        return False
+
 def get_vector_store():
     """Get or initialize Qdrant vector store"""
     global _vector_store
     if _vector_store is None:
         qdrant_client = QdrantClient(
             url=current_app.config['QDRANT_URL'],
-            api_key=current_app.config.get('QDRANT_API_KEY')
+            api_key=current_app.config.get('QDRANT_API_KEY'),
+            timeout=current_app.config['QDRANT_TIMEOUT']
         )
         
         _vector_store = QdrantVectorStore(
@@ -137,39 +222,91 @@ def get_vector_store():
         )
     return _vector_store
 
-def get_llm(thinking_budget: Optional[int] = None):
-    """Get or initialize ChatVertexAI with optional thinking_budget override"""
-    global _llm
+def get_llm(thinking_budget: Optional[int] = None, max_output_tokens: Optional[int] = None,
+            temperature: Optional[float] = None, model_name: Optional[str] = None):
+    """
+    Get the ChatVertexAI client for these generation settings (thinking_budget defaults to 0, the rest to config).
     
-    # If a specific thinking_budget is requested, create a new instance
-    if thinking_budget is not None:
-        return ChatVertexAI(
-            model_name=current_app.config['GEMINI_MODEL'],
-            project=current_app.config['PROJECT_ID'],
-            location=current_app.config['GEMINI_LOCATION'],
-            max_output_tokens=current_app.config.get('LLM_MAX_TOKENS', 2048),
-            temperature=current_app.config.get('LLM_TEMPERATURE', 0.7),
-            top_p=current_app.config.get('LLM_TOP_P', 0.8),
-            top_k=current_app.config.get('LLM_TOP_K', 40),
-            thinking_budget=thinking_budget
-        )
+    Clients are shared by all requests of a worker: one per (model, thinking_budget, max tokens, temperature),
+    so each keeps its credentials and transport connections across requests.
+    """
+    model_name = model_name or current_app.config['GEMINI_MODEL']
+    thinking_budget = 0 if thinking_budget is None else thinking_budget
+    max_output_tokens = max_output_tokens or current_app.config.get('LLM_MAX_TOKENS', 2048)
+    temperature = current_app.config.get('LLM_TEMPERATURE', 0.7) if temperature is None else temperature
+    key = (model_name, thinking_budget, max_output_tokens, temperature)
     
-    # Otherwise, use the cached instance with default thinking_budget=0
-    if _llm is None:
-        _llm = ChatVertexAI(
-            model_name=current_app.config['GEMINI_MODEL'],
-            project=current_app.config['PROJECT_ID'],
-            location=current_app.config['GEMINI_LOCATION'],
-            max_output_tokens=current_app.config.get('LLM_MAX_TOKENS', 8192),
-            temperature=current_app.config.get('LLM_TEMPERATURE', 0.7),
-            top_p=current_app.config.get('LLM_TOP_P', 0.8),
-            top_k=current_app.config.get('LLM_TOP_K', 40),
-            thinking_budget=0
-        )
-    return _llm
+    with _llm_clients_lock:
+        llm = _llm_clients.get(key)
+        if llm is None:
+            llm = ChatVertexAI(
+                model_name=model_name,
+                project=current_app.config['PROJECT_ID'],
+                location=current_app.config['GEMINI_LOCATION'],
+                max_output_tokens=max_output_tokens,
+                temperature=temperature,
+                top_p=current_app.config.get('LLM_TOP_P', 0.8),
+                top_k=current_app.config.get('LLM_TOP_K', 40),
+                thinking_budget=thinking_budget,
+                timeout=current_app.config['LLM_TIMEOUT'],
+                max_retries=current_app.config['LLM_MAX_RETRIES']
+            )
+            _llm_clients[key] = llm
+    return llm
 
-def get_retriever(num_results: int = 5, filter_dict: Optional[Dict] = None):
-    """Get a retriever with optional filtering"""
+def _search_kwargs_field() -> ConfigurableField:
+    return ConfigurableField(id="search_kwargs", name="Search kwargs", description="k and filter of the vector search")
+
+def get_local_retriever():
+    """Configurable retriever over the in-process TF-IDF index of the knowledge base CSVs"""
+    index = get_local_index(current_app._get_current_object())
+    return LocalIndexRetriever(index=index, search_kwargs={"k": 5}).configurable_fields(search_kwargs=_search_kwargs_field())
+
+def get_configurable_retriever():
+    """
+    Shared retriever whose search_kwargs (k, filter) are set per invocation.
+    
+    RETRIEVER_BACKEND selects Qdrant ("qdrant"), the local index ("local"), or Qdrant with the local
+    index as fallback ("auto"); in auto mode the local index also serves while Qdrant can't be reached
+    at all, with a new connection attempt every QDRANT_RETRY_INTERVAL seconds.
+    """
+    global _configurable_retriever, _qdrant_retry_at
+    if _configurable_retriever is not None:
+        return _configurable_retriever
+    
+    backend = current_app.config['RETRIEVER_BACKEND']
+    if backend == "local":
+        _configurable_retriever = get_local_retriever()
+        return _configurable_retriever
+    
+    if backend == "auto" and _vector_store is None and time.monotonic() < _qdrant_retry_at:
+        return get_local_retriever()
+    
+    try:
+        retriever = get_vector_store().as_retriever(search_kwargs={"k": 5}).configurable_fields(
+            search_kwargs=_search_kwargs_field()
+        )
+    except Exception as e:
+        if backend != "auto":
+            raise
+        current_app.logger.warning(f"Qdrant unavailable, serving retrieval from the local index: {str(e)}")
+        _qdrant_retry_at = time.monotonic() + QDRANT_RETRY_INTERVAL
+        return get_local_retriever()
+    
+    if backend == "auto":
+        retriever = retriever.with_fallbacks([get_local_retriever()])
+    _configurable_retriever = retriever
+    return _configurable_retriever
+
+def retrieve_question_context(query: str, num_results: int = 5) -> str:
+    """Knowledge base passages for a question, formatted for the QA prompt (retrieved outside the LLM call)"""
+    check_deadline("retrieval")
+    # Resolved per call so answers pick up the retriever once Qdrant becomes reachable
+    docs = get_configurable_retriever().invoke(query, config=retrieval_config(num_results))
+    return format_docs_for_context(docs)
+
+def retrieval_config(num_results: int = 5, filter_dict: Optional[Dict] = None) -> Dict[str, Any]:
+    """Runnable config selecting k and the metadata filter of the configurable retriever"""
     search_kwargs = {"k": num_results}
     
     if filter_dict:
@@ -187,38 +324,69 @@ def get_retriever(num_results: int = 5, filter_dict: Optional[Dict] = None):
             qdrant_filter = Filter(must=conditions)
             search_kwargs["filter"] = qdrant_filter
     
-    return get_vector_store().as_retriever(search_kwargs=search_kwargs)
+    return {"configurable": {"search_kwargs": search_kwargs}}
+
+def get_retriever(num_results: int = 5, filter_dict: Optional[Dict] = None):
+    """Get a retriever with optional filtering (a binding of the shared configurable retriever)"""
+    return get_configurable_retriever().with_config(retrieval_config(num_results, filter_dict))
 
 def format_docs_for_context(docs: List[Document]) -> str:
     """Format retrieved documents into context string"""
     return "\n\n".join([doc.page_content for doc in docs])
 
+def _get_chain(name: str, thinking_budget: Optional[int], build):
+    """Return the cached chain for (name, thinking_budget), building it on first use in this process"""
+    key = (name, 0 if thinking_budget is None else thinking_budget)
+    with _chains_lock:
+        chain = _chains.get(key)
+        if chain is None:
+            chain = build()
+            _chains[key] = chain
+    return chain
+
+def get_qa_chain(thinking_budget: Optional[int] = None):
+    """
+    Chain answering {"context", "question", "target_language"} inputs.
+    
+    Retrieval (retrieve_question_context) is not part of the chain, so the circuit breaker, timeout and
+    hedging of run_llm_call only cover Gemini.
+    """
+    return _get_chain(
+        "qa",
+        thinking_budget,
+        lambda: QA_PROMPT | get_llm(thinking_budget=thinking_budget) | StrOutputParser()
+    )
+
+def get_evaluation_chain():
+    """Chain judging the relevance of an answer to a question"""
+    return _get_chain("evaluation", None, lambda: EVALUATION_PROMPT | get_llm() | StrOutputParser())
+
+def prebuild_chains(thinking_budgets=(0, 256)) -> bool:
+    """Build the chains (and their retriever and LLM clients) before the first request"""
+    try:
+        for thinking_budget in thinking_budgets:
+            get_qa_chain(thinking_budget)
+            get_diagnosis_chain(thinking_budget)
+        get_evaluation_chain()
+        return True
+    except Exception as e:
+        current_app.logger.error(f"Error prebuilding chains: {str(e)}")
+        return False
+
+def generate_answer(query: str, target_language: str = "en", num_results: int = 5, thinking_budget: Optional[int] = None) -> str:
+    """Answer a question using RAG with Langchain, raising on failure"""
+    rag_chain = get_qa_chain(thinking_budget=thinking_budget)
+    context = retrieve_question_context(query, num_results)
+    
+    # Invoke the chain with the retrieved context, query and target_language
+    return run_llm_call("qa", lambda: rag_chain.invoke(
+        {"context": context, "question": query, "target_language": target_language}
+    ))
+
 def answer_question(query: str, target_language: str = "en", model: str = None, num_results: int = 5, thinking_budget: Optional[int] = None) -> str:
-    """Answer a question using RAG with Langchain"""
+    """Answer a question using RAG with Langchain (errors are returned as the answer text)"""
     try:
-        # Get retriever and LLM
-        retriever = get_retriever(num_results=num_results)
-        llm = get_llm(thinking_budget=thinking_budget)
-        
-        # Create prompt template
-        prompt = ChatPromptTemplate.from_template(QA_TEMPLATE)
-        
-        # Create RAG chain using LCEL with proper input routing
-        rag_chain = (
-            {
-                "context": itemgetter("question") | retriever | format_docs_for_context,
-                "question": itemgetter("question"),
-                "target_language": itemgetter("target_language")
-            }
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-        
-        # Invoke the chain with both query and target_language
-        answer = rag_chain.invoke({"question": query, "target_language": target_language})
-        return answer
-        
+        return generate_answer(query, target_language=target_language, num_results=num_results, thinking_budget=thinking_budget)
     except Exception as e:
         current_app.logger.error(f"Error in answer_question: {str(e)}")
         return f"Error generating answer: {str(e)}"
@@ -226,112 +394,418 @@ def answer_question(query: str, target_language: str = "en", model: str = None,
 def evaluate_relevance(question: str, answer: str, model: str = None) -> Dict[str, str]:
     """Evaluate the relevance of the answer to the question"""
     try:
-        llm = get_llm()
-        prompt = ChatPromptTemplate.from_template(EVALUATION_TEMPLATE)
-        
-        # Create evaluation chain
-        eval_chain = prompt | llm | StrOutputParser()
+        eval_chain = get_evaluation_chain()
         
-        evaluation = eval_chain.invoke({
+        evaluation = run_llm_call("evaluation", lambda: eval_chain.invoke({
             "question": question,
             "answer": answer
-        })
+        }))
         
-        # Extract JSON from the response
-        json_match = re.search(r'({.*})', evaluation.replace('\n', ' '))
-        if json_match:
-            json_str = json_match.group(1)
-            json_eval = json.loads(json_str)
-            return json_eval
-        else:
-            return {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
+        return parse_evaluation(evaluation)
             
     except Exception as e:
         current_app.logger.error(f"Error in evaluate_relevance: {str(e)}")
         return {"Relevance": "UNKNOWN", "Explanation": f"Error: {str(e)}"}
 
-def process_diagnosis(acne_types: List[str], user_info: Dict[str, Any], target_language: str = "en", model: str = None, thinking_budget: Optional[int] = None) -> Dict[str, str]:
-    """Process diagnosis results and provide recommendations using RAG"""
+def evaluate_relevance_batch(pairs: List[Dict[str, str]], max_concurrency: int = 4) -> List[Dict[str, str]]:
+    """Evaluate several question/answer pairs with one batched chain call (results keep the input order)"""
     try:
-        # Build patient profile
-        patient_profile = f"""
-        Age: {user_info.get('age', 'Unknown')}
-        Skin Type: {user_info.get('skin_type', 'Unknown')}
-        Skin Tone: {user_info.get('skin_tone', 'Unknown')}
-        Sensitivity: {user_info.get('skin_sensitivity', 'Unknown')}
-        """.strip()
+        eval_chain = get_evaluation_chain()
         
-        # Format detected acne types for the prompt
-        detected_acne_types = "- " + "\n- ".join(acne_types)
-        
-        # Retrieve relevant acne information using server-side filtering
-        acne_info_parts = []
+        def evaluate():
+            evaluations = eval_chain.batch(
+                [{"question": pair["question"], "answer": pair["answer"]} for pair in pairs],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+            # A batch where every call failed counts as a Gemini failure for the circuit breaker
+            if evaluations and all(isinstance(evaluation, Exception) for evaluation in evaluations):
+                raise evaluations[0]
+            return evaluations
         
+        evaluations = run_llm_call("evaluation_batch", evaluate)
+    except Exception as e:
+        current_app.logger.error(f"Error in evaluate_relevance_batch: {str(e)}")
+        return [{"Relevance": "UNKNOWN", "Explanation": f"Error: {str(e)}"} for _ in pairs]
+    
+    results = []
+    for evaluation in evaluations:
+        if isinstance(evaluation, Exception):
+            current_app.logger.error(f"Error in evaluate_relevance_batch: {str(evaluation)}")
+            results.append({"Relevance": "UNKNOWN", "Explanation": f"Error: {str(evaluation)}"})
+            continue
+        try:
+            results.append(parse_evaluation(evaluation))
+        except Exception as e:
+            results.append({"Relevance": "UNKNOWN", "Explanation": f"Error: {str(e)}"})
+    return results
+
+def parse_evaluation(evaluation: str) -> Dict[str, str]:
+    """Extract the JSON verdict from an evaluation response"""
+    json_match = re.search(r'({.*})', evaluation.replace('\n', ' '))
+    if json_match:
+        json_str = json_match.group(1)
+        json_eval = json.loads(json_str)
+        return json_eval
+    else:
+        return {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
+
+def _get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+def get_retrieval_executor() -> Optional[ThreadPoolExecutor]:
+    """Return this process's retrieval thread pool, or None when RETRIEVAL_MAX_WORKERS disables it"""
+    max_workers = current_app.config['RETRIEVAL_MAX_WORKERS']
+    if max_workers <= 1:
+        return None
+    return _get_executor("retrieval", max_workers)
+
+def _call_in_app_context(app, fn, *args):
+    with app.app_context():
+        return fn(*args)
+
+def _submit_in_context(executor, fn, *args):
+    """Submit fn to a pool thread with the caller's app and context variables (the request deadline)"""
+    app = current_app._get_current_object()
+    return executor.submit(copy_context().run, _call_in_app_context, app, fn, *args)
+
+def get_llm_breaker() -> CircuitBreaker:
+    """Circuit breaker guarding Gemini calls of this worker"""
+    global _llm_breaker
+    if _llm_breaker is None:
+        _llm_breaker = CircuitBreaker(
+            "Gemini",
+            failure_threshold=current_app.config['LLM_CIRCUIT_FAILURE_THRESHOLD'],
+            reset_timeout=current_app.config['LLM_CIRCUIT_RESET_TIMEOUT']
+        )
+    return _llm_breaker
+
+def run_llm_call(name: str, fn):
+    """
+    Run a Gemini call within the request deadline (or LLM_TIMEOUT), behind the circuit breaker.
+    
+    Fails fast with CircuitOpenError while the circuit is open and with DeadlineExceededError when the
+    budget runs out. With LLM_HEDGE_ENABLED a second identical call starts once the first has run longer
+    than the observed p95 latency of calls with this name, and the first to finish wins.
+    """
+    check_deadline(name)
+    breaker = get_llm_breaker()
+    breaker.before_call()
+    
+    hedge_after = None
+    if current_app.config['LLM_HEDGE_ENABLED']:
+        p95 = _llm_latency.percentile(name)
+        if p95 is not None:
+            hedge_after = max(current_app.config['LLM_HEDGE_MIN_DELAY'], p95)
+    
+    executor = _get_executor("llm", current_app.config['LLM_CALL_WORKERS'])
+    app = current_app._get_current_object()
+    context = copy_context()
+    
+    def attempt():
+        # Each attempt runs in its own copy of the caller's context (a hedge runs concurrently)
+        return context.copy().run(_call_in_app_context, app, fn)
+    
+    llm_timeout = current_app.config['LLM_TIMEOUT']
+    timeout = bounded(llm_timeout)
+    started_at = time.monotonic()
+    try:
+        result = call_hedged(
+            executor, attempt,
+            timeout=timeout,
+            hedge_after=hedge_after,
+            on_hedge=_llm_latency.record_hedge
+        )
+    except DeadlineExceededError:
+        # Only a timeout at the full LLM_TIMEOUT says upstream is slow, not that the caller was short on time
+        if timeout < llm_timeout:
+            breaker.record_ignored()
+        else:
+            breaker.record_failure()
+        raise
+    except CircuitOpenError:
+        breaker.record_ignored()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    
+    breaker.record_success()
+    _llm_latency.record(name, time.monotonic() - started_at)
+    return result
+
+def llm_call_metrics() -> Dict[str, Any]:
+    """Circuit breaker state and hedging counters of this worker"""
+    return {
+        "circuit": _llm_breaker.metrics() if _llm_breaker is not None else None,
+        "latency": _llm_latency.metrics()
+    }
+
+def retrieve_acne_type_context(acne_type: str, retriever=None) -> List[str]:
+    """Knowledge base passages describing one acne type"""
+    try:
+        # Use server-side filtering to get only acne_types documents
+        if retriever is None:
+            retriever = get_retriever(num_results=3, filter_dict={"source": "acne_types"})
+        search_results = retriever.invoke(acne_type)
+        return [doc.page_content for doc in search_results[:2]]
+    except Exception as filter_error:
+        current_app.logger.warning(f"Server-side filtering failed for {acne_type}, falling back to manual filtering: {str(filter_error)}")
+        # Fallback to manual filtering if server-side filtering fails
+        retriever = get_retriever(num_results=3)
+        search_results = retriever.invoke(acne_type)
+        acne_type_docs = [doc for doc in search_results if doc.metadata.get('source') == 'acne_types']
+        return [doc.page_content for doc in acne_type_docs[:2]]
+
+def retrieve_combination_context(acne_types: List[str], retriever=None) -> List[str]:
+    """Knowledge base passages on treating several acne types together"""
+    combination_query = " ".join(acne_types) + " combination treatment"
+    try:
+        # Try server-side filtering for combination considerations
+        combo_retriever = retriever or get_retriever(num_results=2, filter_dict={"source": "acne_types"})
+        combo_results = combo_retriever.invoke(combination_query)
+    except Exception as combo_filter_error:
+        current_app.logger.warning(f"Server-side filtering failed for combination query, falling back to manual filtering: {str(combo_filter_error)}")
+        # Fallback to manual filtering
+        combo_retriever = get_retriever(num_results=2)
+        combo_results = combo_retriever.invoke(combination_query)
+        combo_results = [doc for doc in combo_results if doc.metadata.get('source') == 'acne_types']
+    return [doc.page_content for doc in combo_results]
+
+def knowledge_base_fingerprint() -> str:
+    """Digest of the acne types CSV and the vector collection state; changes when the knowledge base is rebuilt"""
+    digest = hashlib.sha256()
+    with open(current_app.config['ACNE_TYPES_PATH'], "rb") as f:
+        digest.update(f.read())
+    
+    backend = current_app.config['RETRIEVER_BACKEND']
+    if backend == "local":
+        digest.update(b"local-index")
+        return digest.hexdigest()
+    
+    try:
+        collection = get_vector_store().client.get_collection(current_app.config['QDRANT_COLLECTION_NAME'])
+        digest.update(f"{current_app.config['QDRANT_COLLECTION_NAME']}:{collection.points_count}".encode())
+    except Exception:
+        if backend != "auto":
+            raise
+        # Context resolved from the local index; the fingerprint changes once Qdrant is back
+        digest.update(b"qdrant-unavailable")
+    return digest.hexdigest()
+
+def retrieve_acne_info_concurrently(acne_types: List[str]):
+    """Run the per-type and combination retrievals in parallel, each distinct query once"""
+    # Retrievers are built here, in the request's app context, and shared by all queries
+    type_retriever = get_retriever(num_results=3, filter_dict={"source": "acne_types"})
+    combo_retriever = get_retriever(num_results=2, filter_dict={"source": "acne_types"}) if len(acne_types) > 1 else None
+    unique_types = list(dict.fromkeys(acne_types))
+    
+    check_deadline("retrieval")
+    executor = get_retrieval_executor()
+    if executor is None:
         # Get information for each acne type using server-side filtering
-        for acne_type in acne_types:
-            try:
-                # Use server-side filtering to get only acne_types documents
-                retriever = get_retriever(num_results=3, filter_dict={"source": "acne_types"})
-                search_results = retriever.invoke(acne_type)
-                
-                if search_results:
-                    acne_info_parts.extend([doc.page_content for doc in search_results[:2]])
-            except Exception as filter_error:
-                current_app.logger.warning(f"Server-side filtering failed for {acne_type}, falling back to manual filtering: {str(filter_error)}")
-                # Fallback to manual filtering if server-side filtering fails
-                retriever = get_retriever(num_results=3)
-                search_results = retriever.invoke(acne_type)
-                acne_type_docs = [doc for doc in search_results if doc.metadata.get('source') == 'acne_types']
-                if acne_type_docs:
-                    acne_info_parts.extend([doc.page_content for doc in acne_type_docs[:2]])
-        
+        contexts = {acne_type: retrieve_acne_type_context(acne_type, type_retriever) for acne_type in unique_types}
         # If we have multiple acne types, search for combination considerations
-        if len(acne_types) > 1:
-            combination_query = " ".join(acne_types) + " combination treatment"
+        combination_context = retrieve_combination_context(acne_types, combo_retriever) if combo_retriever else None
+        return [contexts[acne_type] for acne_type in acne_types], combination_context
+    
+    type_futures = {
+        acne_type: _submit_in_context(executor, retrieve_acne_type_context, acne_type, type_retriever)
+        for acne_type in unique_types
+    }
+    combination_future = None
+    if combo_retriever is not None:
+        combination_future = _submit_in_context(executor, retrieve_combination_context, acne_types, combo_retriever)
+    
+    try:
+        # Wait no longer than the request deadline (each Qdrant call is also bounded by QDRANT_TIMEOUT)
+        contexts = {acne_type: future.result(timeout=bounded(None)) for acne_type, future in type_futures.items()}
+        combination_context = combination_future.result(timeout=bounded(None)) if combination_future is not None else None
+    except FutureTimeoutError:
+        raise DeadlineExceededError("Deadline exceeded during retrieval")
+    return [contexts[acne_type] for acne_type in acne_types], combination_context
+
+def build_acne_info(acne_types: List[str]) -> str:
+    """ACNE INFORMATION for the diagnosis prompt, from the precomputed context table or live retrieval"""
+    context_table = getattr(current_app, "diagnosis_context", None)
+    precomputed = context_table.lookup(acne_types) if context_table is not None else None
+    
+    if precomputed is not None:
+        type_contexts, combination_context = precomputed
+    else:
+        type_contexts, combination_context = retrieve_acne_info_concurrently(acne_types)
+    
+    acne_info_parts = []
+    for passages in type_contexts:
+        acne_info_parts.extend(passages)
+    
+    if combination_context:
+        acne_info_parts.append("COMBINATION CONSIDERATIONS:")
+        acne_info_parts.extend(combination_context)
+    
+    return "\n\n".join(acne_info_parts)
+
+def build_diagnosis_inputs(acne_types: List[str], user_info: Dict[str, Any], target_language: str = "en") -> Dict[str, str]:
+    """Prompt inputs of the diagnosis chain, including the retrieved acne information"""
+    # Build patient profile
+    patient_profile = f"""
+    Age: {user_info.get('age', 'Unknown')}
+    Skin Type: {user_info.get('skin_type', 'Unknown')}
+    Skin Tone: {user_info.get('skin_tone', 'Unknown')}
+    Sensitivity: {user_info.get('skin_sensitivity', 'Unknown')}
+    """.strip()
+    
+    # Format detected acne types for the prompt
+    detected_acne_types = "- " + "\n- ".join(acne_types)
+    
+    # Retrieve relevant acne information (precomputed table when available)
+    acne_info = build_acne_info(acne_types)
+    
+    return {
+        "patient_profile": patient_profile,
+        "detected_acne_types": detected_acne_types,
+        "acne_info": acne_info,
+        "target_language": target_language
+    }
+
+def get_diagnosis_chain(thinking_budget: Optional[int] = None):
+    """Chain generating the markdown recommendations from build_diagnosis_inputs()"""
+    return _get_chain(
+        "diagnosis",
+        thinking_budget,
+        lambda: DIAGNOSIS_PROMPT | get_llm(thinking_budget=thinking_budget) | StrOutputParser()
+    )
+
+def generate_diagnosis(acne_types: List[str], user_info: Dict[str, Any], target_language: str = "en", thinking_budget: Optional[int] = None) -> Dict[str, str]:
+    """Recommendation sections for the detected acne types, raising on failure"""
+    inputs = build_diagnosis_inputs(acne_types, user_info, target_language)
+    
+    diagnosis_chain = get_diagnosis_chain(thinking_budget=thinking_budget)
+    
+    # Generate response with detected acne types
+    response = run_llm_call("diagnosis", lambda: diagnosis_chain.invoke(inputs))
+    
+    # Parse the response into sections
+    return parse_recommendation_sections(response)
+
+def diagnosis_fallback(error: Exception) -> Dict[str, str]:
+    """Generic recommendation sections returned when generation failed"""
+    current_app.logger.error(f"Error in process_diagnosis: {str(error)}")
+    # Return error in structured format
+    return {
+        "overview": f"Error generating diagnosis: {str(error)}",
+        "recommendations": "Please consult with a dermatologist for specific treatment recommendations.",
+        "skincare_tips": "Maintain good skincare hygiene and use appropriate products for your skin type.",
+        "important_notes": "Consult a healthcare professional for serious skin concerns."
+    }
+
+def process_diagnosis(acne_types: List[str], user_info: Dict[str, Any], target_language: str = "en", model: str = None, thinking_budget: Optional[int] = None) -> Dict[str, str]:
+    """Process diagnosis results and provide recommendations using RAG"""
+    try:
+        return generate_diagnosis(acne_types, user_info, target_language=target_language, thinking_budget=thinking_budget)
+    except Exception as e:
+        return diagnosis_fallback(e)
+
+def _tracked_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """
+    Pass LLM stream chunks through behind the circuit breaker.
+    
+    The first chunk must arrive within the request deadline (or LLM_TIMEOUT) and every later one within
+    LLM_STREAM_IDLE_TIMEOUT of the previous, so an answer that keeps making progress is not cut off by
+    the total request deadline. Chunks are pulled on the LLM thread pool (in one copied context), so a
+    stalled upstream raises DeadlineExceededError instead of holding the response open.
+    """
+    check_deadline("streaming")
+    breaker = get_llm_breaker()
+    breaker.before_call()
+    
+    llm_timeout = current_app.config['LLM_TIMEOUT']
+    idle_timeout = current_app.config['LLM_STREAM_IDLE_TIMEOUT']
+    executor = _get_executor("llm", current_app.config['LLM_CALL_WORKERS'])
+    context = copy_context()
+    iterator = iter(chunks)
+    finished = object()
+    
+    timeout = bounded(llm_timeout)
+    # Only waiting on the request's own (shorter) budget says nothing about upstream
+    caller_bound = timeout < llm_timeout
+    
+    def close(_=None):
+        # The upstream generator must be closed in the context it ran in, after its last pull finished
+        try:
+            context.run(getattr(iterator, "close", lambda: None))
+        except Exception as e:
+            print(f"Failed to close LLM stream: {str(e)}")
+    
+    pending = None
+    failed = False
+    try:
+        while True:
+            pending = executor.submit(context.run, next, iterator, finished)
             try:
-                # Try server-side filtering for combination considerations
-                combo_retriever = get_retriever(num_results=2, filter_dict={"source": "acne_types"})
-                combo_results = combo_retriever.invoke(combination_query)
-            except Exception as combo_filter_error:
-                current_app.logger.warning(f"Server-side filtering failed for combination query, falling back to manual filtering: {str(combo_filter_error)}")
-                # Fallback to manual filtering
-                combo_retriever = get_retriever(num_results=2)
-                combo_results = combo_retriever.invoke(combination_query)
-                combo_results = [doc for doc in combo_results if doc.metadata.get('source') == 'acne_types']
-            
-            if combo_results:
-                acne_info_parts.append("COMBINATION CONSIDERATIONS:")
-                acne_info_parts.extend([doc.page_content for doc in combo_results])
-        
-        acne_info = "\n\n".join(acne_info_parts)
-        
-        # Create diagnosis chain
-        llm = get_llm(thinking_budget=thinking_budget)
-        prompt = ChatPromptTemplate.from_template(DIAGNOSIS_TEMPLATE)
-        
-        diagnosis_chain = prompt | llm | StrOutputParser()
-        
-        # Generate response with detected acne types
-        response = diagnosis_chain.invoke({
-            "patient_profile": patient_profile,
-            "detected_acne_types": detected_acne_types,
-            "acne_info": acne_info,
-            "target_language": target_language
-        })
-        
-        # Parse the response into sections
-        sections = parse_recommendation_sections(response)
-        return sections
+                chunk = pending.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise DeadlineExceededError("LLM stream stalled before the next token")
+            if chunk is finished:
+                break
+            yield chunk
+            timeout, caller_bound = idle_timeout, False
+    except DeadlineExceededError:
+        failed = True
+        if caller_bound:
+            breaker.record_ignored()
+        else:
+            breaker.record_failure()
+        raise
+    except CircuitOpenError:
+        # A nested call was refused: nothing learned about upstream
+        failed = True
+        breaker.record_ignored()
+        raise
+    except Exception:
+        failed = True
+        breaker.record_failure()
+        raise
+    finally:
+        # Also reached when the client disconnects mid-stream (GeneratorExit): upstream was fine
+        if not failed:
+            breaker.record_success()
+        if pending is None:
+            close()
+        else:
+            pending.add_done_callback(close)
+
+def stream_diagnosis(acne_types: List[str], user_info: Dict[str, Any], target_language: str = "en",
+                     thinking_budget: Optional[int] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Generate diagnosis recommendations incrementally.
+    
+    Yields ("token", text) for every chunk from the LLM and ("section", {"name", "content"}) as soon as a
+    section is complete (the next heading has arrived, or the response ended), then ("sections", dict)
+    with the same structure process_diagnosis returns. Errors propagate to the caller.
+    """
+    inputs = build_diagnosis_inputs(acne_types, user_info, target_language)
+    diagnosis_chain = get_diagnosis_chain(thinking_budget=thinking_budget)
+    
+    response = ""
+    completed = 0
+    for chunk in _tracked_stream(diagnosis_chain.stream(inputs)):
+        response += chunk
+        yield "token", chunk
         
-    except Exception as e:
-        current_app.logger.error(f"Error in process_diagnosis: {str(e)}")
-        # Return error in structured format
-        return {
-            "overview": f"Error generating diagnosis: {str(e)}",
-            "recommendations": "Please consult with a dermatologist for specific treatment recommendations.",
-            "skincare_tips": "Maintain good skincare hygiene and use appropriate products for your skin type.",
-            "important_notes": "Consult a healthcare professional for serious skin concerns."
-        }
+        # A section is complete once the heading of the next one has appeared
+        while completed < len(DIAGNOSIS_SECTIONS) - 1 and DIAGNOSIS_SECTIONS[completed + 1][0] in response:
+            name = DIAGNOSIS_SECTIONS[completed][1]
+            yield "section", {"name": name, "content": parse_recommendation_sections(response)[name]}
+            completed += 1
+    
+    sections = parse_recommendation_sections(response)
+    for _, name in DIAGNOSIS_SECTIONS[completed:]:
+        yield "section", {"name": name, "content": sections[name]}
+    yield "sections", sections
 
 def parse_recommendation_sections(recommendation_text: str) -> Dict[str, str]:
     """Parse recommendation text into structured sections"""
@@ -376,7 +850,8 @@ def parse_recommendation_sections(recommendation_text: str) -> Dict[str, str]:
 
 def rag(query: str, target_language: str = "en", 
         translation_method: str = "google", 
-        model: str = None, thinking_budget: Optional[int] = None) -> Dict[str, Any]:
+        model: str = None, thinking_budget: Optional[int] = None,
+        evaluate: bool = True) -> Dict[str, Any]:
     """
     Streamlined RAG function with integrated multilingual support
     
@@ -386,6 +861,8 @@ def rag(query: str, target_language: str = "en",
         translation_method: Translation method (deprecated, kept for compatibility)
         model: LLM model to use (default: from configuration)
         thinking_budget: Thinking budget for the LLM (default: None, uses cached instance with 0)
+        evaluate: Evaluate relevance inline; when False the result is marked PENDING and the
+            caller is expected to queue the evaluation (see evaluation_queue.py)
         
     Returns:
         Dictionary with answer and metadata
@@ -403,14 +880,23 @@ def rag(query: str, target_language: str = "en",
     source_language = translation_svc.detect_language(query)
     
     # Step 2: Process the query directly with RAG, letting the LLM handle the language
-    final_answer = answer_question(query, target_language=target_language, model=model, thinking_budget=thinking_budget)
+    try:
+        final_answer = generate_answer(query, target_language=target_language, thinking_budget=thinking_budget)
+        degraded = False
+    except Exception as e:
+        current_app.logger.error(f"Error in answer_question: {str(e)}")
+        final_answer = f"Error generating answer: {str(e)}"
+        degraded = True
     
     # Step 3: Evaluate relevance (using the original query)
-    relevance_result = evaluate_relevance(
-        question=query,
-        answer=final_answer,
-        model=model
-    )
+    if evaluate:
+        relevance_result = evaluate_relevance(
+            question=query,
+            answer=final_answer,
+            model=model
+        )
+    else:
+        relevance_result = {"Relevance": "PENDING", "Explanation": "Evaluation queued"}
     
     # Calculate timing
     t1 = time.time()
@@ -425,11 +911,50 @@ def rag(query: str, target_language: str = "en",
         "target_language": target_language,
         "translation_method": "integrated_llm",  # Updated to reflect new approach
         "relevance": relevance_result.get("Relevance", "UNKNOWN"),
-        "relevance_explanation": relevance_result.get("Explanation", "Failed to parse evaluation")
+        "relevance_explanation": relevance_result.get("Explanation", "Failed to parse evaluation"),
+        # The answer is an error message, not something to share or cache
+        "degraded": degraded
     }
     
     return result
 
+def rag_stream(query: str, target_language: str = "en", model: str = None,
+               thinking_budget: Optional[int] = None, evaluate: bool = True) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of rag(): yields ("token", text) as the answer is generated, then ("result", dict)
+    with the same fields rag() returns. Errors propagate to the caller.
+    """
+    if model is None:
+        model = current_app.config['DEFAULT_MODEL']
+    
+    t0 = time.time()
+    source_language = TranslationService().detect_language(query)
+    
+    rag_chain = get_qa_chain(thinking_budget=thinking_budget)
+    context = retrieve_question_context(query)
+    chunks = []
+    for chunk in _tracked_stream(rag_chain.stream({"context": context, "question": query, "target_language": target_language})):
+        chunks.append(chunk)
+        yield "token", chunk
+    final_answer = "".join(chunks)
+    
+    if evaluate:
+        relevance_result = evaluate_relevance(question=query, answer=final_answer, model=model)
+    else:
+        relevance_result = {"Relevance": "PENDING", "Explanation": "Evaluation queued"}
+    
+    yield "result", {
+        "answer": final_answer,
+        "model_used": model,
+        "response_time": time.time() - t0,
+        "original_language": source_language,
+        "target_language": target_language,
+        "translation_method": "integrated_llm",
+        "relevance": relevance_result.get("Relevance", "UNKNOWN"),
+        "relevance_explanation": relevance_result.get("Explanation", "Failed to parse evaluation"),
+        "degraded": False
+    }
+
 # Legacy function compatibility - these functions are no longer used but kept for backward compatibility
 def search(query: str, filter_dict: Dict = None, num_results: int = 5) -> List[Dict]:
     """Legacy search function - replaced by Qdrant vector search"""
@@ -73,7 +73,10 @@ class Index:
                 mask = self.keyword_df[field] == value
                 scores = scores * mask.to_numpy()
 
-        # Get top results
+        # Get top results (argpartition needs num_results <= number of documents)
+        num_results = min(num_results, len(self.docs))
+        if num_results <= 0:
+            return []
         top_indices = np.argpartition(scores, -num_results)[-num_results:]
         top_indices = top_indices[np.argsort(-scores[top_indices])]
 
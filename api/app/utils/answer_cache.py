@@ -0,0 +1,175 @@
+import re
+import copy
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def normalize_question(question):
+    """Canonical form of a question for embedding: lowercase, single spaces, no trailing punctuation"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+class SemanticAnswerCache:
+    """
+    Cache of /question answers looked up by embedding similarity of the normalized question.
+
+    Entries are partitioned by (target_language, model) so a hit never returns an answer in the
+    wrong language. A lookup is a hit when the cosine similarity to a stored question reaches
+    threshold. The in-memory tier is per worker with LRU and TTL eviction. The optional SQLite file
+    persists entries across restarts and is loaded once when the cache is created.
+    """
+
+    def __init__(self, embed_fn, threshold=0.95, max_entries=512, ttl=86400, db_path=None):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.db_path = db_path or None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked unit vectors of all entries, rebuilt lazily after inserts and evictions
+        self._matrix = None
+        self._matrix_keys = []
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            self._load_db()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id TEXT PRIMARY KEY, partition TEXT, question TEXT, vector BLOB, answer TEXT, created REAL)"
+        )
+        return connection
+
+    def _load_db(self):
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+                rows = connection.execute(
+                    "SELECT id, partition, question, vector, answer, created FROM answers ORDER BY created DESC LIMIT ?",
+                    (self.max_entries,)
+                ).fetchall()
+            connection.close()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Failed to load answer cache from {self.db_path}: {str(e)}")
+            return
+
+        for entry_id, partition, question, vector, answer, created in reversed(rows):
+            expires_at = time.monotonic() + self.ttl - (time.time() - created)
+            self._entries[entry_id] = {
+                "partition": partition,
+                "question": question,
+                "vector": np.frombuffer(vector, dtype=np.float32),
+                "answer_data": json.loads(answer),
+                "expires_at": expires_at
+            }
+        self._matrix = None
+
+    def _write_db(self, entry_id, entry, evicted_ids):
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                    (entry_id, entry["partition"], entry["question"], entry["vector"].tobytes(),
+                     json.dumps(entry["answer_data"]), time.time())
+                )
+                connection.executemany("DELETE FROM answers WHERE id = ?", [(i,) for i in evicted_ids])
+            connection.close()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Failed to write answer cache entry: {str(e)}")
+
+    @staticmethod
+    def partition_for(target_language, model):
+        return f"{target_language}|{model}"
+
+    def embed(self, question):
+        """Unit embedding of the normalized question, or None when embedding fails"""
+        try:
+            vector = np.asarray(self.embed_fn(normalize_question(question)), dtype=np.float32)
+        except Exception as e:
+            print(f"Answer cache embedding failed: {str(e)}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _stacked(self):
+        # Caller holds the lock
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            if self._matrix_keys:
+                self._matrix = np.stack([self._entries[key]["vector"] for key in self._matrix_keys])
+            else:
+                self._matrix = np.empty((0, 0), dtype=np.float32)
+        return self._matrix, self._matrix_keys
+
+    def lookup(self, vector, target_language, model):
+        """Return (answer_data copy, similarity) of the closest stored question, or (None, best similarity)"""
+        partition = self.partition_for(target_language, model)
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+            for key in expired:
+                del self._entries[key]
+            if expired:
+                self._matrix = None
+
+            matrix, keys = self._stacked()
+            best_key, best_similarity = None, 0.0
+            if len(keys) and matrix.shape[1] == vector.shape[0]:
+                similarities = matrix @ vector
+                for index in np.argsort(similarities)[::-1]:
+                    if self._entries[keys[index]]["partition"] == partition:
+                        best_key, best_similarity = keys[index], float(similarities[index])
+                        break
+
+            if best_key is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None, best_similarity
+
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            answer_data = self._entries[best_key]["answer_data"]
+
+        return copy.deepcopy(answer_data), best_similarity
+
+    def store(self, vector, question, target_language, model, answer_data):
+        """Remember an answer for the question embedded as vector"""
+        entry = {
+            "partition": self.partition_for(target_language, model),
+            "question": question,
+            "vector": vector.astype(np.float32),
+            "answer_data": copy.deepcopy(answer_data),
+            "expires_at": time.monotonic() + self.ttl
+        }
+        evicted_ids = []
+        with self._lock:
+            self._next_id += 1
+            entry_id = f"{time.time_ns()}-{self._next_id}"
+            self._entries[entry_id] = entry
+            while len(self._entries) > self.max_entries:
+                evicted_id, _ = self._entries.popitem(last=False)
+                evicted_ids.append(evicted_id)
+            self._matrix = None
+
+        if self.db_path:
+            self._write_db(entry_id, entry, evicted_ids)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,20 @@
+import time
+import queue
+
+def collect_batch(source, max_size, max_wait):
+    """
+    Block for the first item of source (a queue.Queue), then gather more until max_size items were
+    taken or max_wait seconds passed since the first one arrived.
+    """
+    batch = [source.get()]
+    window_closes_at = time.monotonic() + max_wait
+    while len(batch) < max_size:
+        remaining = window_closes_at - time.monotonic()
+        try:
+            if remaining > 0:
+                batch.append(source.get(timeout=remaining))
+            else:
+                batch.append(source.get_nowait())
+        except queue.Empty:
+            break
+    return batch
@@ -0,0 +1,83 @@
+import time
+import threading
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit is open, carries a Retry-After hint in seconds"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for an upstream dependency.
+
+    After failure_threshold consecutive failures the circuit opens and calls fail fast for
+    reset_timeout seconds. Then a single trial call is let through (half open): success closes the
+    circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._rejected = 0
+        self._trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self._rejected += 1
+            retry_after = max(1, int(self.reset_timeout - (time.monotonic() - self._opened_at)) + 1)
+        raise CircuitOpenError(f"{self.name} is temporarily unavailable", retry_after=retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._trips += 1
+            self._trial_in_flight = False
+
+    def record_ignored(self):
+        """The call ended without saying anything about upstream health (e.g. the caller ran out of time)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "rejected": self._rejected
+            }
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+from itertools import combinations
+
+def combination_key(acne_types):
+    return "|".join(sorted(acne_types))
+
+class DiagnosisContextTable:
+    """
+    Precomputed retrieval context for every acne type label and every combination of labels.
+
+    The knowledge base and the label set are small and static, so process_diagnosis can assemble its
+    ACNE INFORMATION from this in-memory table instead of running live vector searches. Combinations
+    are precomputed up to max_combination_size labels (larger ones are rare and use live retrieval),
+    and the table is built on a background thread, callers use live retrieval until it is ready. It is
+    tied to a knowledge base fingerprint (CSV digest plus collection state). The fingerprint is
+    re-checked at most every check_interval seconds; when it changes the table is dropped, callers
+    fall back to live retrieval and a background thread rebuilds it. With cache_path set the table is
+    also written to disk so other workers (and restarts) load it instead of rebuilding.
+    """
+
+    def __init__(self, app, labels, resolve_type, resolve_combination, fingerprint_fn,
+                 check_interval=300, cache_path=None, max_combination_size=None):
+        self.app = app
+        self.labels = list(labels)
+        self.resolve_type = resolve_type
+        self.resolve_combination = resolve_combination
+        self.fingerprint_fn = fingerprint_fn
+        self.check_interval = check_interval
+        self.cache_path = cache_path or None
+        self.max_combination_size = max_combination_size or len(self.labels)
+
+        self._table = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._building = False
+
+    def _load_cached(self, fingerprint):
+        try:
+            with open(self.cache_path, "r") as f:
+                table = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return table if table.get("fingerprint") == fingerprint else None
+
+    def _write_cached(self, table):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(table, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Failed to write diagnosis context table {self.cache_path}: {str(e)}")
+
+    def build(self):
+        """Resolve the context of every label and label combination (or load a matching table from disk)"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+        fingerprint = self.fingerprint_fn()
+        table = self._load_cached(fingerprint) if self.cache_path else None
+
+        if table is None:
+            started_at = time.time()
+            table = {"fingerprint": fingerprint, "types": {}, "combinations": {}}
+            for label in self.labels:
+                table["types"][label] = self.resolve_type(label)
+            for size in range(2, self.max_combination_size + 1):
+                for combination in combinations(self.labels, size):
+                    table["combinations"][combination_key(combination)] = self.resolve_combination(list(combination))
+            print(f"Built diagnosis context table ({len(table['types'])} types, "
+                  f"{len(table['combinations'])} combinations) in {time.time() - started_at:.1f}s")
+            if self.cache_path:
+                self._write_cached(table)
+
+        with self._lock:
+            self._table = table
+            self._checked_at = time.monotonic()
+        return table
+
+    def build_in_background(self):
+        """Start build() on a background thread unless one is already running"""
+        def run():
+            try:
+                with self.app.app_context():
+                    self.build()
+            except Exception as e:
+                print(f"Failed to rebuild diagnosis context table: {str(e)}")
+            finally:
+                with self._lock:
+                    self._building = False
+
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=run, name="diagnosis-context-build", daemon=True).start()
+
+    def _current_table(self):
+        with self._lock:
+            table = self._table
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return table
+            # Only the first caller past the interval re-checks the fingerprint (or retries a failed build)
+            self._checked_at = time.monotonic()
+
+        if table is None:
+            self.build_in_background()
+            return None
+
+        try:
+            fingerprint = self.fingerprint_fn()
+        except Exception as e:
+            print(f"Knowledge base fingerprint check failed, keeping the diagnosis context table: {str(e)}")
+            return table
+
+        if fingerprint == table["fingerprint"]:
+            return table
+
+        print("Knowledge base changed, rebuilding the diagnosis context table")
+        with self._lock:
+            if self._table is table:
+                self._table = None
+        self.build_in_background()
+        return None
+
+    def lookup(self, acne_types):
+        """Return (per-type contexts, combination context or None), or None when the table can't serve the request"""
+        table = self._current_table()
+        if table is None or len(set(acne_types)) != len(acne_types):
+            return None
+        if any(acne_type not in table["types"] for acne_type in acne_types):
+            return None
+
+        combination = None
+        if len(acne_types) > 1:
+            combination = table["combinations"].get(combination_key(acne_types))
+            if combination is None:
+                return None
+
+        return [table["types"][acne_type] for acne_type in acne_types], combination
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self._table is not None
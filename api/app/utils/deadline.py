@@ -0,0 +1,38 @@
+import time
+import contextvars
+
+# Monotonic time by which the current request must be answered (None: no budget)
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+class DeadlineExceededError(Exception):
+    """The request's latency budget ran out before a stage could finish"""
+
+def start_deadline(seconds):
+    """Give the current context a budget of seconds (never extending an earlier, tighter one); returns a reset token"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    return _deadline.set(deadline)
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+def remaining(default=None):
+    """Seconds left in the current budget (floored at 0), or default when there is no budget"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return max(0.0, deadline - time.monotonic())
+
+def bounded(timeout):
+    """The smaller of timeout and the remaining budget"""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+def check_deadline(stage):
+    """Raise DeadlineExceededError if the budget is already spent before stage starts"""
+    if remaining() == 0.0:
+        raise DeadlineExceededError(f"Deadline exceeded before {stage}")
@@ -0,0 +1,212 @@
+import numpy as np
+
+def decode_yolo_output(detections, image_width, image_height, confidence_threshold):
+    """
+    Decode a raw YOLO output tensor into pixel-space boxes with NumPy array operations
+    
+    Args:
+        detections: Output tensor of shape (4 + num_classes, num_anchors) holding normalized
+            x_center, y_center, width, height followed by the class confidences
+        image_width: Width of the image the boxes are scaled to
+        image_height: Height of the image the boxes are scaled to
+        confidence_threshold: Minimum confidence for a detection to be kept
+        
+    Returns:
+        Tuple of (boxes, scores) where boxes is an int32 array of shape (N, 4) in
+        x1, y1, x2, y2 order clamped to the image, and scores is a float32 array of shape (N,)
+    """
+    detections = np.asarray(detections, dtype=np.float32)
+    
+    # Single-class heads carry the confidence in row 4, multi-class heads take the best class
+    if detections.shape[0] > 5:
+        confidences = detections[4:].max(axis=0)
+    else:
+        confidences = detections[4]
+    
+    # Apply the confidence threshold before doing any box arithmetic
+    keep = confidences >= confidence_threshold
+    x_center, y_center, width, height = detections[:4, keep]
+    scores = confidences[keep]
+    
+    # Convert normalized xywh to pixel xyxy (truncating like int() does)
+    x_center_px = x_center * image_width
+    y_center_px = y_center * image_height
+    half_width_px = width * image_width / 2
+    half_height_px = height * image_height / 2
+    
+    boxes = np.stack([
+        x_center_px - half_width_px,
+        y_center_px - half_height_px,
+        x_center_px + half_width_px,
+        y_center_px + half_height_px
+    ], axis=1)
+    boxes = np.trunc(boxes).astype(np.int32)
+    
+    # Clamp to the image bounds
+    np.clip(boxes[:, 0::2], 0, image_width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, image_height, out=boxes[:, 1::2])
+    
+    # Drop boxes that collapsed after clamping
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes[valid], scores[valid]
+
+# Above this many candidates the IoU matrix is computed tile by tile to bound memory
+NMS_TILE_SIZE = 256
+
+def _box_areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+def _pairwise_iou(boxes_a, boxes_b, areas_a, areas_b):
+    """IoU matrix of shape (len(boxes_a), len(boxes_b)) from precomputed areas (float64 boxes, so the epsilon survives)"""
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    
+    intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    union = areas_a[:, None] + areas_b[None, :] - intersection
+    return intersection / (union + 1e-6)
+
+def _offset_by_class(boxes, class_ids):
+    """Shift boxes of different classes apart so they can never overlap"""
+    if class_ids is None:
+        return boxes
+    offsets = np.asarray(class_ids, dtype=np.float64) * (boxes.max() + 1)
+    return boxes + offsets[:, None]
+
+def _greedy_suppress(suppresses, alive, limit):
+    """Greedy pass over a score-sorted upper-triangle suppression matrix, returns kept positions"""
+    keep = []
+    for i in range(len(alive)):
+        if not alive[i]:
+            continue
+        keep.append(i)
+        if limit is not None and len(keep) >= limit:
+            break
+        # Only lower-ranked boxes can be suppressed by box i
+        alive[i + 1:] &= ~suppresses[i, i + 1:]
+    return keep
+
+def nms_indices(boxes, scores, iou_threshold=0.5, max_detections=None, class_ids=None, tile_size=NMS_TILE_SIZE):
+    """
+    Hard non-maximum suppression
+    
+    Args:
+        boxes: Array of shape (N, 4) in x1, y1, x2, y2 order
+        scores: Array of shape (N,)
+        iou_threshold: Boxes overlapping a kept box by at least this IoU are suppressed
+        max_detections: Stop once this many boxes are kept (None keeps all)
+        class_ids: Optional array of shape (N,) to suppress only within the same class
+        tile_size: Candidate count above which the IoU matrix is computed in tiles
+        
+    Returns:
+        int64 array of kept indices into boxes, ordered by descending score
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    # Sort once, every later step works on score-ranked positions
+    order = np.argsort(-scores, kind="stable")
+    # float64 like the original loop: in float32 the 1e-6 in the IoU denominator rounds away and
+    # pairs exactly at the threshold flip from kept to suppressed
+    sorted_boxes = _offset_by_class(np.asarray(boxes, dtype=np.float64), class_ids)[order]
+    areas = _box_areas(sorted_boxes)
+    
+    if len(order) <= tile_size:
+        # Small N: one IoU matrix, read upper-triangle only since only lower-ranked boxes can be suppressed
+        suppresses = _pairwise_iou(sorted_boxes, sorted_boxes, areas, areas) >= iou_threshold
+        alive = np.ones(len(order), dtype=bool)
+        keep = _greedy_suppress(suppresses, alive, max_detections)
+        return order[keep]
+    
+    # Large N: walk score-ranked tiles, suppressing each against the boxes kept so far
+    keep = []
+    for start in range(0, len(order), tile_size):
+        stop = min(start + tile_size, len(order))
+        tile_boxes = sorted_boxes[start:stop]
+        tile_areas = areas[start:stop]
+        
+        alive = np.ones(stop - start, dtype=bool)
+        if keep:
+            kept = np.asarray(keep)
+            kept_iou = _pairwise_iou(tile_boxes, sorted_boxes[kept], tile_areas, areas[kept])
+            alive &= ~(kept_iou >= iou_threshold).any(axis=1)
+        
+        suppresses = _pairwise_iou(tile_boxes, tile_boxes, tile_areas, tile_areas) >= iou_threshold
+        limit = None if max_detections is None else max_detections - len(keep)
+        keep.extend(start + i for i in _greedy_suppress(suppresses, alive, limit))
+        
+        if max_detections is not None and len(keep) >= max_detections:
+            break
+    
+    return order[keep]
+
+def soft_nms_indices(boxes, scores, iou_threshold=0.5, sigma=0.5, score_threshold=0.001, method="gaussian",
+                     max_detections=None, class_ids=None):
+    """
+    Soft non-maximum suppression: overlapping boxes have their score decayed instead of being dropped
+    
+    Args:
+        method: "gaussian" decays by exp(-iou^2 / sigma), "linear" by (1 - iou) above iou_threshold
+        score_threshold: Boxes whose decayed score falls below this are dropped
+        
+    Returns:
+        Tuple of (indices, decayed_scores) ordered by descending decayed score
+    """
+    scores = np.array(scores, dtype=np.float32)
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    
+    boxes = _offset_by_class(np.asarray(boxes, dtype=np.float64), class_ids)
+    areas = _box_areas(boxes)
+    
+    remaining = np.arange(len(scores))
+    keep = []
+    while len(remaining):
+        best = np.argmax(scores[remaining])
+        current = remaining[best]
+        keep.append(current)
+        if max_detections is not None and len(keep) >= max_detections:
+            break
+        
+        remaining = np.delete(remaining, best)
+        if not len(remaining):
+            break
+        
+        iou = _pairwise_iou(boxes[current:current + 1], boxes[remaining], areas[current:current + 1], areas[remaining])[0]
+        if method == "linear":
+            decay = np.where(iou >= iou_threshold, 1 - iou, 1)
+        else:
+            decay = np.exp(-(iou * iou) / sigma)
+        scores[remaining] *= decay
+        remaining = remaining[scores[remaining] >= score_threshold]
+    
+    keep = np.asarray(keep, dtype=np.int64)
+    return keep, scores[keep]
+
+def non_max_suppression(boxes, scores, iou_threshold=0.5, max_detections=None, class_ids=None, mode="hard",
+                        sigma=0.5, score_threshold=0.001, soft_method="gaussian"):
+    """
+    Suppress overlapping detections and return compact arrays
+    
+    Args:
+        mode: "hard" drops overlapping boxes, "soft" decays their scores (see soft_nms_indices)
+        soft_method: Score decay of soft mode, "gaussian" or "linear"
+    
+    Returns:
+        Tuple of (boxes, scores) where boxes has shape (K, 4) with the dtype of the input
+        and scores has shape (K,), ordered by descending score
+    """
+    boxes = np.asarray(boxes)
+    scores = np.asarray(scores, dtype=np.float32)
+    
+    if mode == "soft":
+        keep, kept_scores = soft_nms_indices(
+            boxes, scores, iou_threshold=iou_threshold, sigma=sigma, score_threshold=score_threshold,
+            method=soft_method, max_detections=max_detections, class_ids=class_ids
+        )
+        return boxes[keep], kept_scores
+    
+    keep = nms_indices(boxes, scores, iou_threshold=iou_threshold, max_detections=max_detections, class_ids=class_ids)
+    return boxes[keep], scores[keep]
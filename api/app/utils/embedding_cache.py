@@ -0,0 +1,122 @@
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different spellings of the same text share a cache entry"""
+    return re.sub(r"\s+", " ", text).strip()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Exact-match cache in front of an embeddings model.
+
+    Vectors are keyed by model name, kind (query or document, which Vertex AI embeds with different
+    task types) and the normalized text. The in-memory tier is a per-worker LRU. The optional SQLite
+    file is shared by all workers and survives restarts.
+    """
+
+    def __init__(self, embeddings, model_name, max_entries=2048, db_path=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max(1, int(max_entries))
+        self.db_path = db_path or None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text, kind):
+        return f"{self.model_name}|{kind}|{normalize_text(text)}"
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        return connection
+
+    def _read_db(self, keys):
+        try:
+            connection = self._connect()
+            found = {}
+            for key in keys:
+                row = connection.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    found[key] = np.frombuffer(row[0], dtype=np.float32).tolist()
+            connection.close()
+            return found
+        except (sqlite3.Error, OSError) as e:
+            print(f"Failed to read embedding cache: {str(e)}")
+            return {}
+
+    def _write_db(self, vectors):
+        try:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+                )
+            connection.close()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Failed to write embedding cache: {str(e)}")
+
+    def _remember(self, vectors):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _embed(self, texts, kind, embed_fn):
+        keys = [self._key(text, kind) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.db_path:
+            from_db = self._read_db(missing)
+            self._remember(from_db)
+            found.update(from_db)
+            missing = [key for key in missing if key not in from_db]
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+        if missing:
+            # Embed each distinct missing text once, in a single upstream call
+            first_text = {}
+            for text, key in zip(texts, keys):
+                first_text.setdefault(key, text)
+            computed = dict(zip(missing, embed_fn([first_text[key] for key in missing])))
+            self._remember(computed)
+            if self.db_path:
+                self._write_db(computed)
+            found.update(computed)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query", lambda missing: [self.embeddings.embed_query(missing[0])])[0]
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
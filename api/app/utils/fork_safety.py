@@ -0,0 +1,18 @@
+import os
+import weakref
+
+def reset_after_fork(method):
+    """
+    Call the bound method in every child forked from this process (each gunicorn worker), before any
+    request runs there. Threads, pools, clients and locks of the parent must not be used by a child.
+
+    Only a weak reference to the object is kept, so registering does not keep it alive.
+    """
+    ref = weakref.WeakMethod(method)
+
+    def reset():
+        bound = ref()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=reset)
@@ -0,0 +1,79 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+from app.utils.deadline import DeadlineExceededError
+
+class LatencyTracker:
+    """Rolling latency window per call name, used to pick the hedging delay"""
+
+    def __init__(self, window=200, quantile=0.95, min_samples=20):
+        self.window = window
+        self.quantile = quantile
+        self.min_samples = min_samples
+
+        self._samples = {}
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name):
+        """Latency quantile for name, or None until enough calls were observed"""
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.quantile(samples, self.quantile))
+
+    def record_hedge(self, won):
+        with self._lock:
+            self.hedged += 1
+            self.hedge_wins += int(won)
+
+    def metrics(self):
+        with self._lock:
+            names = list(self._samples)
+            stats = {"hedged": self.hedged, "hedge_wins": self.hedge_wins}
+        stats["p95"] = {name: self.percentile(name) for name in names}
+        return stats
+
+def call_hedged(executor, fn, timeout, hedge_after=None, on_hedge=None):
+    """
+    Run fn on executor and return its result within timeout seconds.
+
+    When hedge_after is set and the first attempt is still running after hedge_after seconds, a second
+    attempt starts and whichever finishes successfully first wins (on_hedge(won) reports whether it was
+    the hedge). Raises DeadlineExceededError when no attempt finished in time; abandoned attempts run
+    to completion in the background, bounded by the client's own timeout.
+    """
+    if timeout is not None and timeout <= 0:
+        raise DeadlineExceededError("No time left for the call")
+
+    ends_at = None if timeout is None else time.monotonic() + timeout
+    futures = [executor.submit(fn)]
+    hedge = None
+    if hedge_after is not None and (timeout is None or hedge_after < timeout):
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            hedge = executor.submit(fn)
+            futures.append(hedge)
+
+    error = None
+    while futures:
+        left = None if ends_at is None else max(0.0, ends_at - time.monotonic())
+        done, _ = wait(futures, timeout=left, return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceededError("Call did not finish within its deadline")
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                if hedge is not None and on_hedge is not None:
+                    on_hedge(future is hedge)
+                return future.result()
+            error = error or future.exception()
+    raise error
@@ -0,0 +1,103 @@
+import cv2
+
+# Start-of-frame markers carry the image dimensions (DHT, JPG and DAC share the range but do not)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+_REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+def _exif_orientation(tiff):
+    """Orientation tag (0x0112) from the IFD0 of an EXIF TIFF block, 1 when absent"""
+    if len(tiff) < 8:
+        return 1
+    if tiff[:2] == b"II":
+        byteorder = "little"
+    elif tiff[:2] == b"MM":
+        byteorder = "big"
+    else:
+        return 1
+
+    ifd = int.from_bytes(tiff[4:8], byteorder)
+    if ifd + 2 > len(tiff):
+        return 1
+    entry_count = int.from_bytes(tiff[ifd:ifd + 2], byteorder)
+    for k in range(entry_count):
+        entry = ifd + 2 + 12 * k
+        if entry + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[entry:entry + 2], byteorder) == 0x0112:
+            orientation = int.from_bytes(tiff[entry + 8:entry + 10], byteorder)
+            return orientation if 1 <= orientation <= 8 else 1
+    return 1
+
+def read_jpeg_header(data):
+    """
+    Read the stored dimensions and EXIF orientation of a JPEG without decoding it
+    
+    Returns:
+        Tuple of (width, height, orientation); width and height are None if data is not a JPEG
+        or has no frame header before the image data
+    """
+    if data[:2] != b"\xff\xd8":
+        return None, None, 1
+
+    orientation = 1
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker == 0xE1 and data[i + 4:i + 10] == b"Exif\x00\x00":
+            orientation = _exif_orientation(bytes(data[i + 10:i + 2 + length]))
+        elif marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height, orientation
+        elif marker == 0xDA:
+            # Start of scan: no frame header found
+            break
+        i += 2 + length
+
+    return None, None, orientation
+
+def reduced_decode_flag(width, height, max_dimension):
+    """Largest IMREAD_REDUCED_COLOR_* scale that keeps the longest side at or above max_dimension"""
+    if not max_dimension or not width or not height:
+        return cv2.IMREAD_COLOR
+    longest_side = max(width, height)
+    for factor, flag in _REDUCED_COLOR_FLAGS:
+        if longest_side / factor >= max_dimension:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def apply_exif_orientation(img, orientation):
+    """Rotate/flip a decoded image so it is displayed upright according to its EXIF orientation"""
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
@@ -0,0 +1,279 @@
+import json
+import binascii
+from flask import Request, current_app
+
+# Bytes read from the request stream per iteration
+CHUNK_SIZE = 64 * 1024
+# Upper bound for the non-image part of a JSON body (user_info, model, language...)
+MAX_JSON_FIELDS_BYTES = 64 * 1024
+
+_BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_NON_BASE64 = bytes(c for c in range(256) if c not in _BASE64_ALPHABET)
+
+class ImageUploadError(ValueError):
+    """Invalid image upload, carries the HTTP status code to answer with"""
+    status_code = 400
+
+class ImageTooLargeError(ImageUploadError):
+    status_code = 413
+
+class UnsupportedImageError(ImageUploadError):
+    status_code = 415
+
+def sniff_image_type(header):
+    """Identify an image format from its first bytes, None if it is not a supported image"""
+    header = bytes(header[:12])
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header.startswith(b"BM"):
+        return "bmp"
+    return None
+
+class _ImageBuffer:
+    """Growing decode buffer that enforces the size limit and sniffs the header as soon as it arrives"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.data = bytearray()
+        self.image_type = None
+
+    def write(self, chunk):
+        if len(self.data) + len(chunk) > self.max_bytes:
+            raise ImageTooLargeError(f"Image exceeds the {self.max_bytes / (1024 * 1024):.1f} MB limit")
+        self.data += chunk
+        if self.image_type is None and len(self.data) >= 12:
+            self._sniff()
+
+    def _sniff(self):
+        self.image_type = sniff_image_type(self.data)
+        if self.image_type is None:
+            raise UnsupportedImageError("Unsupported image format, expected JPEG, PNG, WebP or BMP")
+
+    def finish(self):
+        if not self.data:
+            raise ImageUploadError("Empty image data")
+        if self.image_type is None:
+            self._sniff()
+        return self.data
+
+class ImageUploadStream:
+    """
+    Target for multipart file parts that writes straight into a decode buffer while the body is parsed.
+
+    Uploads never spool to a temporary file, and an oversized or non-image part is rejected on its first
+    bytes. Werkzeug silently drops ValueErrors raised while parsing a form, so the rejection is kept
+    (discarding the rest of the part) and raised when the route reads the file.
+    """
+
+    def __init__(self, max_bytes):
+        self._buffer = _ImageBuffer(max_bytes)
+        self._error = None
+        self._position = 0
+
+    def write(self, chunk):
+        if self._error is None:
+            try:
+                self._buffer.write(chunk)
+            except ImageUploadError as e:
+                self._error = e
+                self._buffer.data = bytearray()
+        return len(chunk)
+
+    def finish(self):
+        """The complete upload, or the error that rejected it"""
+        if self._error is not None:
+            raise self._error
+        return self._buffer.finish()
+
+    def read(self, size=-1):
+        if self._error is not None:
+            raise self._error
+        end = len(self._buffer.data) if size is None or size < 0 else self._position + size
+        chunk = bytes(self._buffer.data[self._position:end])
+        self._position += len(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        newline = self._buffer.data.find(b"\n", self._position)
+        end = len(self._buffer.data) if newline == -1 else newline + 1
+        if size is not None and size >= 0:
+            end = min(end, self._position + size)
+        return self.read(end - self._position)
+
+    def seek(self, offset, whence=0):
+        base = {0: 0, 1: self._position, 2: len(self._buffer.data)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        pass
+
+class ImageUploadRequest(Request):
+    """Request whose multipart file parts go to an ImageUploadStream limited to MAX_IMAGE_BYTES"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return ImageUploadStream(current_app.config['MAX_IMAGE_BYTES'])
+
+def read_image_stream(stream, max_bytes, chunk_size=CHUNK_SIZE):
+    """Read an uploaded file stream straight into a decode buffer, rejecting oversized or non-image data early"""
+    if isinstance(stream, ImageUploadStream):
+        # Already buffered (and checked) while the form was parsed
+        return stream.finish()
+    buffer = _ImageBuffer(max_bytes)
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        buffer.write(chunk)
+    return buffer.finish()
+
+class Base64StreamDecoder:
+    """Incrementally decode base64 text (optionally a data URL, possibly JSON-escaped) into an image buffer"""
+
+    def __init__(self, max_bytes):
+        self._buffer = _ImageBuffer(max_bytes)
+        self._head = b""
+        self._in_body = False
+        self._pending = b""
+        self._carry = b""
+
+    def feed(self, text):
+        if not self._in_body:
+            # Hold back the start until a data URL prefix ("data:image/jpeg;base64,") can be stripped
+            self._head += text
+            if self._head.startswith(b"data:"):
+                comma = self._head.find(b",")
+                if comma == -1:
+                    if len(self._head) > 256:
+                        raise ImageUploadError("Invalid base64 image data: malformed data URL")
+                    return
+                text = self._head[comma + 1:]
+            elif len(self._head) < 5 and b"data:".startswith(self._head):
+                return
+            else:
+                text = self._head
+            self._head = b""
+            self._in_body = True
+
+        # A JSON escape may be split across chunks
+        text = self._carry + text
+        self._carry = b""
+        if text.endswith(b"\\"):
+            text, self._carry = text[:-1], b"\\"
+        text = text.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"")
+        text = self._pending + text.translate(None, _NON_BASE64)
+
+        # Decode whole 4-character groups, keep the remainder for the next chunk
+        aligned = len(text) - len(text) % 4
+        self._pending = text[aligned:]
+        if aligned:
+            self._decode(text[:aligned])
+
+    def _decode(self, text):
+        try:
+            self._buffer.write(binascii.a2b_base64(text))
+        except binascii.Error as e:
+            raise ImageUploadError(f"Invalid base64 image data: {str(e)}")
+
+    def finish(self):
+        if not self._in_body:
+            # The whole string was shorter than a data URL prefix
+            head, self._head = self._head, b""
+            if head.startswith(b"data:"):
+                raise ImageUploadError("Invalid base64 image data: malformed data URL")
+            self._in_body = True
+            self.feed(head)
+        if self._pending:
+            self._decode(self._pending + b"=" * (-len(self._pending) % 4))
+            self._pending = b""
+        return self._buffer.finish()
+
+def parse_json_image_stream(stream, max_bytes, image_key="image", chunk_size=CHUNK_SIZE):
+    """
+    Parse a JSON request body whose top-level image_key holds a base64 image, without buffering the image text
+    
+    The image string is streamed through a Base64StreamDecoder chunk by chunk; everything else
+    is kept (with an empty image string) and parsed with json.loads at the end.
+    
+    Returns:
+        Tuple of (fields, image_data) where image_data is None when the body has no image
+    """
+    target_key = image_key.encode()
+    fields = bytearray()
+    decoder = None
+    image_data = None
+
+    depth = 0
+    in_string = False
+    escape = False
+    expect_value = False
+    key = bytearray()
+    in_image = False
+
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        i = 0
+        while i < len(chunk):
+            if in_image:
+                # Base64 never contains a quote, so the next one ends the image string
+                end = chunk.find(b'"', i)
+                if end == -1:
+                    decoder.feed(chunk[i:])
+                    break
+                decoder.feed(chunk[i:end])
+                image_data = decoder.finish()
+                in_image = False
+                in_string = False
+                fields.append(0x22)
+                i = end + 1
+                continue
+
+            c = chunk[i]
+            fields.append(c)
+            i += 1
+
+            if in_string:
+                if escape:
+                    escape = False
+                elif c == 0x5C:  # backslash
+                    escape = True
+                elif c == 0x22:  # closing quote
+                    in_string = False
+                elif depth == 1 and not expect_value and len(key) <= len(target_key):
+                    key.append(c)
+                continue
+
+            if c == 0x22:  # opening quote
+                in_string = True
+                if depth == 1 and expect_value and key == target_key:
+                    in_image = True
+                    decoder = Base64StreamDecoder(max_bytes)
+                elif depth == 1 and not expect_value:
+                    key = bytearray()
+            elif c in (0x7B, 0x5B):  # { [
+                depth += 1
+            elif c in (0x7D, 0x5D):  # } ]
+                depth -= 1
+            elif depth == 1 and c == 0x3A:  # :
+                expect_value = True
+            elif depth == 1 and c == 0x2C:  # ,
+                expect_value = False
+
+            if len(fields) > MAX_JSON_FIELDS_BYTES:
+                raise ImageUploadError("JSON fields are too large")
+
+    if in_image:
+        raise ImageUploadError("Invalid JSON body: unterminated image string")
+
+    try:
+        parsed = json.loads(bytes(fields)) if fields else {}
+    except ValueError as e:
+        raise ImageUploadError(f"Invalid JSON body: {str(e)}")
+    if not isinstance(parsed, dict):
+        raise ImageUploadError("Invalid JSON body: expected an object")
+
+    parsed.pop(image_key, None)
+    return parsed, image_data
@@ -3,7 +3,7 @@ import pandas as pd
 from flask import current_app
 from app.services.search_service import Index
 
-def load_index(app=None):
+def load_index(app=None, vectorizer_params=None):
     """Load data from CSV files and create search index"""
     if app:
         acne_types_path = app.config.get('ACNE_TYPES_PATH', 'data/knowledge-base/acne_types.csv')
@@ -18,6 +18,11 @@ def load_index(app=None):
     # Load data
     acne_types_df = pd.read_csv(acne_types_path, sep=';')
     faqs_df = pd.read_csv(faqs_path, sep=';')
+    
+    # Empty cells would reach TfidfVectorizer as NaN floats; stray spaces in headers break field lookups
+    for df in (acne_types_df, faqs_df):
+        df.columns = df.columns.str.strip()
+        df.fillna('', inplace=True)
 
     # Convert to documents
     acne_documents = acne_types_df.to_dict(orient='records')
@@ -40,7 +45,8 @@ def load_index(app=None):
             'Expected Timeline', 'Combination Considerations', 'Skin Type Adjustments',
             'Age-Specific Considerations', 'Question', 'Answer', 'Category'
         ],
-        keyword_fields=['source']
+        keyword_fields=['source'],
+        vectorizer_params=vectorizer_params or {}
     )
     
     # Fit the index with all documents
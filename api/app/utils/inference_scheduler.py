@@ -0,0 +1,103 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+class InferenceUnavailableError(Exception):
+    """Raised when an inference request cannot be admitted, carries a Retry-After hint in seconds"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class InferenceSaturatedError(InferenceUnavailableError):
+    """The wait queue is full"""
+
+class InferenceDeadlineError(InferenceUnavailableError):
+    """No inference slot became free before the request deadline"""
+
+class InferenceScheduler:
+    """Bounded queue in front of CPU inference with a concurrency limit, deadlines and metrics"""
+
+    def __init__(self, max_concurrency=1, max_queue=4, default_deadline=10.0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.default_deadline = default_deadline
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._admitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_wait_time = 0.0
+        self._total_run_time = 0.0
+
+    def _estimate_retry_after(self):
+        """Seconds until the current backlog is expected to drain"""
+        average_run_time = self._total_run_time / self._completed if self._completed else 1.0
+        backlog = (self._waiting + self._running) / self.max_concurrency
+        return max(1, math.ceil(average_run_time * backlog))
+
+    def _acquire(self, deadline):
+        # Fast path: a slot is free, no queueing
+        if self._slots.acquire(blocking=False):
+            return
+
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise InferenceSaturatedError("Inference queue is full", retry_after=self._estimate_retry_after())
+            self._waiting += 1
+
+        try:
+            acquired = self._slots.acquire(timeout=deadline)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        if not acquired:
+            with self._lock:
+                self._timed_out += 1
+                retry_after = self._estimate_retry_after()
+            raise InferenceDeadlineError(f"No inference slot available within {deadline} seconds", retry_after=retry_after)
+
+    @contextmanager
+    def slot(self, deadline=None):
+        """Hold one inference slot for the duration of the block, waiting at most deadline seconds"""
+        deadline = self.default_deadline if deadline is None else deadline
+        queued_at = time.monotonic()
+        self._acquire(deadline)
+
+        started_at = time.monotonic()
+        with self._lock:
+            self._running += 1
+            self._admitted += 1
+            self._total_wait_time += started_at - queued_at
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._total_run_time += time.monotonic() - started_at
+            self._slots.release()
+
+    def metrics(self):
+        """Snapshot of queue depth and counters for this worker"""
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_depth": self._waiting,
+                "in_flight": self._running,
+                "admitted": self._admitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_wait_ms": round(self._total_wait_time / self._admitted * 1000, 1) if self._admitted else 0.0,
+                "avg_run_ms": round(self._total_run_time / self._completed * 1000, 1) if self._completed else 0.0
+            }
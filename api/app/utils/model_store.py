@@ -0,0 +1,33 @@
+import os
+import tflite_runtime.interpreter as tflite
+
+# Model flatbuffers loaded before gunicorn forks its workers, keyed by absolute path
+_model_content = {}
+
+def preload_model_content(*model_paths):
+    """Read TFLite model files once so forked workers inherit them copy-on-write"""
+    for model_path in model_paths:
+        if not model_path:
+            continue
+        key = os.path.abspath(model_path)
+        if key in _model_content:
+            continue
+        try:
+            with open(model_path, "rb") as f:
+                _model_content[key] = f.read()
+            print(f"Preloaded model {model_path} ({len(_model_content[key]) / 1e6:.1f} MB)")
+        except OSError as e:
+            print(f"Failed to preload model {model_path}: {str(e)}")
+    return len(_model_content)
+
+def get_model_content(model_path):
+    """Return the preloaded flatbuffer for a model path, or None if it was not preloaded"""
+    return _model_content.get(os.path.abspath(model_path))
+
+def create_interpreter(model_path, num_threads=None):
+    """Create a TFLite interpreter from the preloaded flatbuffer when available, from the file otherwise"""
+    model_content = get_model_content(model_path)
+    if model_content is not None:
+        # The interpreter references the buffer without copying it, so workers share the master's pages
+        return tflite.Interpreter(model_content=model_content, num_threads=num_threads)
+    return tflite.Interpreter(model_path=model_path, num_threads=num_threads)
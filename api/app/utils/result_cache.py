@@ -0,0 +1,167 @@
+import os
+import json
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+def file_digest(path):
+    """SHA-256 of a file, used to tie cached results to the exact model files that produced them"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DiagnosisResultCache:
+    """
+    Cache of DiagnosisPipeline.process results keyed by the uploaded image bytes and the model digests.
+    
+    The in-memory tier is per worker with LRU and TTL eviction. The optional disk tier (point it at
+    /dev/shm to keep it in shared memory) lets all gunicorn workers share hits; at most every
+    sweep_interval seconds a write sweeps it, deleting expired entries and then the oldest ones
+    beyond disk_max_entries.
+    """
+
+    def __init__(self, model_paths, max_entries=32, ttl=3600, disk_dir=None, disk_max_entries=256, sweep_interval=60):
+        self.model_paths = [path for path in model_paths if path]
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = max(1, int(disk_max_entries))
+        self.sweep_interval = sweep_interval
+        self._swept_at = 0.0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_digest = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model_digest(self):
+        """Combined digest of the model files, computed once; a model upgrade changes every key"""
+        if self._model_digest is None:
+            digest = hashlib.sha256()
+            for path in self.model_paths:
+                digest.update(file_digest(path).encode())
+            self._model_digest = digest.hexdigest()
+        return self._model_digest
+
+    def key_for(self, image_data, options=None):
+        """Cache key for the encoded image bytes plus any options (decoding included) that change the result"""
+        digest = hashlib.sha256()
+        digest.update(self.model_digest.encode())
+        digest.update(image_data)
+        if options:
+            digest.update(json.dumps(options, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, result):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so other workers never read a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write diagnosis cache entry {key}: {str(e)}")
+            return
+
+        with self._lock:
+            if time.monotonic() - self._swept_at < self.sweep_interval:
+                return
+            self._swept_at = time.monotonic()
+        self._sweep_disk()
+
+    def _sweep_disk(self):
+        """Delete expired disk entries, then the oldest ones beyond disk_max_entries"""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    modified_at = os.path.getmtime(path)
+                    # Leftover temp files of crashed writers expire like entries
+                    if now - modified_at > self.ttl:
+                        os.remove(path)
+                    elif name.endswith(".json"):
+                        entries.append((modified_at, path))
+                except OSError:
+                    # Another worker removed it first
+                    continue
+
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.disk_max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss"""
+        result = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, cached = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    result = cached
+                else:
+                    del self._entries[key]
+
+        if result is None and self.disk_dir:
+            result = self._read_disk(key)
+            if result is not None:
+                self._remember(key, result)
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        # Callers restructure the response dict, never hand out the stored one
+        return copy.deepcopy(result)
+
+    def set(self, key, result):
+        """Store a result in memory and, when configured, on disk"""
+        result = copy.deepcopy(result)
+        self._remember(key, result)
+        if self.disk_dir:
+            self._write_disk(key, result)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,206 @@
+import os
+import copy
+import json
+import time
+import fcntl
+import hashlib
+import threading
+
+def flight_key(*parts):
+    """Stable key for the JSON-serializable parts that make two requests identical"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        # Set only when the leader produced a result its waiters may use
+        self.shared = False
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls so only one of them does the upstream work.
+
+    The first caller for a key (the leader) runs the function; callers arriving while it runs wait
+    up to wait_timeout seconds for a copy of its result. Only successful results are shared: when the
+    leader raises, or returns something the shareable predicate rejects (a degraded fallback), the
+    waiters start over with a new leader from among them; a waiter whose wait times out runs the
+    function itself.
+
+    With lock_dir set, leaders of different gunicorn workers also coordinate through a lock file per
+    key: the worker holding the lock computes the result, the ones that were blocked on the lock while
+    it ran read it from the directory instead of recomputing. Every participant holds a shared lock on
+    the key's .wait file, and the last one out deletes the result and the lock files, so the directory
+    only holds keys in flight. Callers arriving after the leader finished never see its result, so the
+    directory is not a cache. Results must be JSON-serializable for the cross-worker path.
+    """
+
+    def __init__(self, wait_timeout=60, lock_dir=None):
+        self.wait_timeout = wait_timeout
+        self.lock_dir = lock_dir or None
+
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "retries": 0, "shared_across_workers": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def do(self, key, fn, timeout=None, shareable=None):
+        """
+        Return fn() for this key, sharing one call among concurrent callers (timeout caps the waits).
+
+        shareable(result) decides whether a result may be handed to other callers (default: all results).
+        """
+        wait_timeout = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            started = time.monotonic()
+            if not flight.done.wait(wait_timeout):
+                self._count("timeouts")
+                return fn()
+            if not flight.shared:
+                # The leader failed or degraded (possibly on its own shorter deadline): the waiters try
+                # again, coalescing behind a new leader within what is left of their wait
+                self._count("retries")
+                left = max(0.0, wait_timeout - (time.monotonic() - started))
+                return self.do(key, fn, timeout=left, shareable=shareable)
+            self._count("coalesced")
+            return copy.deepcopy(flight.result)
+
+        self._count("leaders")
+        try:
+            result, shared = self._run_leader(key, fn, wait_timeout, shareable)
+            if shared:
+                flight.result = result
+                flight.shared = True
+                return copy.deepcopy(result)
+            return result
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _run_leader(self, key, fn, wait_timeout, shareable):
+        """Return (result, whether waiters may use it)"""
+        if not self.lock_dir:
+            result = fn()
+            return result, shareable is None or shareable(result)
+
+        try:
+            wait_file = self._register(key)
+            lock_file = open(os.path.join(self.lock_dir, f"{key}.lock"), "w")
+        except OSError as e:
+            print(f"Single-flight lock unavailable, running without it: {str(e)}")
+            result = fn()
+            return result, shareable is None or shareable(result)
+
+        try:
+            waiting_since = time.time()
+            deadline = time.monotonic() + wait_timeout
+            blocked = False
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # Another worker is computing the same result
+                    blocked = True
+                    if time.monotonic() >= deadline:
+                        self._count("timeouts")
+                        return fn(), False
+                    time.sleep(0.05)
+
+            if blocked:
+                shared = self._read_result(key, waiting_since)
+                if shared is not None:
+                    self._count("shared_across_workers")
+                    return shared, True
+
+            result = fn()
+            if shareable is None or shareable(result):
+                self._write_result(key, result)
+                return result, True
+            self._remove_result(key)
+            return result, False
+        finally:
+            lock_file.close()
+            self._release(key, wait_file)
+
+    def _register(self, key):
+        """Open the key's .wait file holding a shared lock, which keeps its files from being deleted"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, f"{key}.wait")
+        while True:
+            wait_file = open(path, "a")
+            fcntl.flock(wait_file, fcntl.LOCK_SH)
+            try:
+                # The last participant of a previous flight may have unlinked it before we got the lock
+                if os.stat(path).st_ino == os.fstat(wait_file.fileno()).st_ino:
+                    return wait_file
+            except FileNotFoundError:
+                pass
+            wait_file.close()
+
+    def _release(self, key, wait_file):
+        """Drop this caller's registration; the last participant deletes the result and the key's lock files"""
+        try:
+            fcntl.flock(wait_file, fcntl.LOCK_UN)
+            fcntl.flock(wait_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._remove_result(key)
+            for suffix in ("lock", "wait"):
+                try:
+                    os.remove(os.path.join(self.lock_dir, f"{key}.{suffix}"))
+                except FileNotFoundError:
+                    pass
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            print(f"Failed to clean up single-flight files {key}: {str(e)}")
+        finally:
+            wait_file.close()
+
+    def _result_path(self, key):
+        return os.path.join(self.lock_dir, f"{key}.json")
+
+    def _read_result(self, key, waiting_since):
+        """The result of a leader that finished while this caller was blocked, or None"""
+        try:
+            with open(self._result_path(key), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("finished_at", 0) < waiting_since:
+            return None
+        return entry.get("result")
+
+    def _write_result(self, key, result):
+        path = self._result_path(key)
+        try:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"finished_at": time.time(), "result": result}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Failed to share single-flight result {key}: {str(e)}")
+
+    def _remove_result(self, key):
+        try:
+            os.remove(self._result_path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Failed to remove single-flight result {key}: {str(e)}")
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        return stats
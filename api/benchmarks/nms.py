@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of non-maximum suppression: the original greedy loop that
+re-slices the candidate list every iteration against the sort-once engine in
+app/utils/detection_postprocess.py (matrix path and tiled path).
+
+Run from the api directory:
+    python benchmarks/nms.py --boxes 2000 --repeat 20
+"""
+import os
+import sys
+import argparse
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.detection_postprocess import nms_indices, non_max_suppression
+
+def non_max_suppression_loop(boxes, scores, iou_threshold=0.5):
+    """Reference implementation: the NMS previously defined in diagnosis_service"""
+    if len(boxes) == 0:
+        return []
+    
+    boxes = np.array(boxes)
+    scores = np.array(scores)
+    
+    indices = np.argsort(scores)[::-1]
+    
+    keep = []
+    while len(indices) > 0:
+        current = indices[0]
+        keep.append(current)
+        
+        if len(indices) == 1:
+            break
+            
+        current_box = boxes[current]
+        remaining_boxes = boxes[indices[1:]]
+        
+        x1 = np.maximum(current_box[0], remaining_boxes[:, 0])
+        y1 = np.maximum(current_box[1], remaining_boxes[:, 1])
+        x2 = np.minimum(current_box[2], remaining_boxes[:, 2])
+        y2 = np.minimum(current_box[3], remaining_boxes[:, 3])
+        
+        intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+        
+        area_current = (current_box[2] - current_box[0]) * (current_box[3] - current_box[1])
+        area_remaining = (remaining_boxes[:, 2] - remaining_boxes[:, 0]) * (remaining_boxes[:, 3] - remaining_boxes[:, 1])
+        union = area_current + area_remaining - intersection
+        
+        iou = intersection / (union + 1e-6)
+        
+        indices = indices[1:][iou < iou_threshold]
+    
+    return [boxes[i] for i in keep], [scores[i] for i in keep]
+
+def make_boxes(num_boxes, width=4032, height=3024, seed=0):
+    """Random clustered boxes resembling dense lesion detections"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([0, 0], [width, height], size=(max(1, num_boxes // 8), 2))
+    picked = centers[rng.integers(0, len(centers), size=num_boxes)] + rng.normal(0, 15, size=(num_boxes, 2))
+    sizes = rng.uniform(20, 120, size=(num_boxes, 2))
+    boxes = np.concatenate([picked - sizes / 2, picked + sizes / 2], axis=1)
+    boxes = np.clip(boxes, 0, [width, height, width, height]).astype(np.int32)
+    # Distinct scores so both implementations rank ties identically
+    scores = rng.permutation(num_boxes).astype(np.float32) / num_boxes
+    return boxes, scores
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--boxes", type=int, default=2000, help="Number of candidate boxes")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU threshold")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed iterations per implementation")
+    args = parser.parse_args()
+
+    boxes, scores = make_boxes(args.boxes)
+
+    # All implementations must keep the same boxes before their timings mean anything
+    loop_boxes = np.array(non_max_suppression_loop(boxes, scores, args.iou)[0]).reshape(-1, 4)
+    matrix_keep = nms_indices(boxes, scores, args.iou, tile_size=max(args.boxes, 1))
+    tiled_keep = nms_indices(boxes, scores, args.iou, tile_size=256)
+    assert np.array_equal(loop_boxes, boxes[matrix_keep]), "matrix path mismatch"
+    assert np.array_equal(loop_boxes, boxes[tiled_keep]), "tiled path mismatch"
+    engine_boxes = boxes[matrix_keep]
+
+    timings = {
+        "python loop": lambda: non_max_suppression_loop(boxes, scores, args.iou),
+        "engine (matrix)": lambda: nms_indices(boxes, scores, args.iou, tile_size=max(args.boxes, 1)),
+        "engine (tiled 256)": lambda: nms_indices(boxes, scores, args.iou, tile_size=256),
+        "engine (soft)": lambda: non_max_suppression(boxes, scores, args.iou, mode="soft"),
+        "engine (soft linear)": lambda: non_max_suppression(boxes, scores, args.iou, mode="soft", soft_method="linear"),
+    }
+
+    print(f"boxes={args.boxes} kept={len(engine_boxes)} repeat={args.repeat}")
+    baseline = None
+    for name, run in timings.items():
+        elapsed = timeit.timeit(run, number=args.repeat) / args.repeat
+        baseline = baseline or elapsed
+        print(f"{name:<20} {elapsed * 1000:8.3f} ms  ({baseline / elapsed:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import gc
+
+# Server socket and worker settings (overridable through the environment)
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', '8000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+worker_tmp_dir = "/dev/shm"
+accesslog = "-"
+errorlog = "-"
+
+# Load the app (and the model flatbuffers) once in the master before forking workers
+preload_app = os.getenv('PRELOAD_MODELS', 'false').lower() == 'true'
+
+def when_ready(server):
+    """Keep the preloaded objects out of the garbage collector so forked workers don't copy their pages"""
+    if preload_app:
+        gc.freeze()
+
+def post_fork(server, worker):
+    """Build and warm up this worker's interpreters from the shared model flatbuffers, then the retrieval caches"""
+    if not preload_app:
+        return
+
+    from app.utils.model_warmup import warm_up_diagnosis_models
+
+    flask_app = server.app.wsgi()
+    with flask_app.app_context():
+        warm_up_diagnosis_models(flask_app.diagnosis_pool)
+
+        if flask_app.config['EMBEDDING_CACHE_ENABLED'] and flask_app.config['EMBEDDING_CACHE_PREWARM']:
+            from app.services.rag_service import prewarm_label_embeddings
+            prewarm_label_embeddings()
+
+        from app.services.rag_service import prebuild_chains
+        prebuild_chains()
+
+    if flask_app.diagnosis_context is not None:
+        from app import build_diagnosis_context
+        build_diagnosis_context(flask_app)
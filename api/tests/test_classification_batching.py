@@ -0,0 +1,84 @@
+import numpy as np
+
+from app.services.diagnosis_service import DiagnosisClassificationService
+
+INPUT_SHAPE = [1, 8, 8, 3]
+NUM_CLASSES = 6
+
+class FakeInterpreter:
+    """TFLite interpreter stand-in whose batched allocation fails like an unresizable model"""
+
+    def __init__(self, fail_batched_allocate=True):
+        self.fail_batched_allocate = fail_batched_allocate
+        self.shape = list(INPUT_SHAPE)
+        self.output = None
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = list(shape)
+
+    def allocate_tensors(self):
+        if self.fail_batched_allocate and self.shape[0] > 1:
+            raise RuntimeError("RESHAPE failed to prepare")
+
+    def set_tensor(self, index, data):
+        if list(data.shape) != self.shape:
+            raise ValueError(f"Dimension mismatch. Got {data.shape[0]} but expected {self.shape[0]}")
+        self.output = np.tile(np.eye(NUM_CLASSES, dtype=np.float32)[3], (data.shape[0], 1))
+
+    def invoke(self):
+        pass
+
+    def get_tensor(self, index):
+        return self.output
+
+def make_classifier(interpreter):
+    classifier = DiagnosisClassificationService.__new__(DiagnosisClassificationService)
+    classifier.interpreter = interpreter
+    classifier.class_names = {i: f"class_{i}" for i in range(NUM_CLASSES)}
+    classifier.max_batch = 32
+    classifier.input_index = 0
+    classifier.output_index = 0
+    classifier.input_shape = np.array(INPUT_SHAPE)
+    classifier.target_size = (INPUT_SHAPE[2], INPUT_SHAPE[1])
+    classifier.batch_size = 1
+    classifier.supports_batching = True
+    return classifier
+
+def make_crops(count):
+    return [np.full((12, 12, 3), 128, dtype=np.uint8) for _ in range(count)]
+
+def test_failed_batch_allocation_falls_back_to_single_invokes():
+    interpreter = FakeInterpreter()
+    classifier = make_classifier(interpreter)
+
+    predictions = classifier.predict_batch(make_crops(3))
+
+    assert [p["class"] for p in predictions] == ["class_3"] * 3
+    assert classifier.supports_batching is False
+    assert classifier.batch_size == 1
+    assert interpreter.shape[0] == 1
+
+def test_classifier_keeps_working_after_failed_batch_allocation():
+    classifier = make_classifier(FakeInterpreter())
+
+    classifier.predict_batch(make_crops(3))
+    predictions = classifier.predict_batch(make_crops(5))
+
+    assert len(predictions) == 5
+    assert all(p["class"] == "class_3" for p in predictions)
+
+def test_failed_resize_is_redone_on_next_call():
+    interpreter = FakeInterpreter()
+    classifier = make_classifier(interpreter)
+
+    try:
+        classifier._set_batch_size(4)
+    except RuntimeError:
+        pass
+
+    # Batch size is unknown after the failure, so asking for 1 again resizes the tensor back
+    assert classifier.batch_size is None
+    interpreter.fail_batched_allocate = False
+    classifier._set_batch_size(1)
+    assert interpreter.shape[0] == 1
+    assert classifier.batch_size == 1
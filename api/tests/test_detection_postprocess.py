@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.utils.detection_postprocess import nms_indices, non_max_suppression
+
+def loop_nms(boxes, scores, iou_threshold=0.5):
+    """The greedy loop NMS the engine replaced, as kept indices"""
+    boxes = np.array(boxes)
+    indices = np.argsort(np.array(scores))[::-1]
+    keep = []
+    while len(indices) > 0:
+        current = indices[0]
+        keep.append(current)
+        rest = boxes[indices[1:]]
+        box = boxes[current]
+        x1 = np.maximum(box[0], rest[:, 0])
+        y1 = np.maximum(box[1], rest[:, 1])
+        x2 = np.minimum(box[2], rest[:, 2])
+        y2 = np.minimum(box[3], rest[:, 3])
+        intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+        union = (box[2] - box[0]) * (box[3] - box[1]) + (rest[:, 2] - rest[:, 0]) * (rest[:, 3] - rest[:, 1]) - intersection
+        indices = indices[1:][intersection / (union + 1e-6) < iou_threshold]
+    return keep
+
+def test_boxes_exactly_at_threshold_are_kept():
+    # IoU is exactly 0.5; the original loop kept both thanks to the epsilon in the denominator
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 20]], dtype=np.int32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+
+    kept_boxes, _ = non_max_suppression(boxes, scores, iou_threshold=0.5)
+
+    assert len(kept_boxes) == 2
+
+def test_matrix_and_tiled_paths_match_original_loop():
+    rng = np.random.default_rng(0)
+    corners = rng.integers(0, 200, size=(600, 2))
+    sizes = rng.integers(5, 60, size=(600, 2))
+    boxes = np.concatenate([corners, corners + sizes], axis=1).astype(np.int32)
+    scores = rng.permutation(600).astype(np.float32) / 600
+
+    expected = loop_nms(boxes, scores)
+
+    assert list(nms_indices(boxes, scores, tile_size=len(boxes))) == expected
+    assert list(nms_indices(boxes, scores, tile_size=64)) == expected
+
+def test_soft_linear_method_is_reachable():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 12]], dtype=np.int32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+
+    _, gaussian = non_max_suppression(boxes, scores, mode="soft")
+    _, linear = non_max_suppression(boxes, scores, mode="soft", soft_method="linear")
+
+    assert not np.allclose(gaussian, linear)
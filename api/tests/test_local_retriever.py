@@ -0,0 +1,25 @@
+import pytest
+
+from app.services.local_retriever import LocalIndexRetriever
+from app.services.search_service import Index
+
+DOCS = [
+    {"name": "Papule", "description": "small red bump", "source": "acne_types"},
+    {"name": "Pustule", "description": "bump with pus", "source": "acne_types"},
+    {"name": "Cleanser", "description": "gentle cleanser for red skin", "source": "products"},
+    {"name": "Sunscreen", "description": "daily protection", "source": "products"},
+]
+
+def make_retriever(**search_kwargs):
+    index = Index(text_fields=["name", "description"], keyword_fields=["source"]).fit(DOCS)
+    return LocalIndexRetriever(index=index, search_kwargs=search_kwargs)
+
+def test_filter_keeps_only_matching_documents():
+    docs = make_retriever(k=4, filter={"source": "products"}).invoke("red bump")
+
+    assert docs
+    assert all(doc.metadata["source"] == "products" for doc in docs)
+
+def test_unknown_filter_field_raises():
+    with pytest.raises(ValueError):
+        make_retriever(k=2, filter={"category": "products"}).invoke("red bump")
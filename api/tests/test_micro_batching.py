@@ -0,0 +1,34 @@
+import os
+import queue
+
+from app.services.classification_batcher import MicroBatchClassifier
+from app.utils.batching import collect_batch
+
+class EchoClassifier:
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, crops):
+        self.batches.append(len(crops))
+        return [{"class": crop} for crop in crops]
+
+def test_collect_batch_stops_at_max_size():
+    source = queue.Queue()
+    for i in range(5):
+        source.put(i)
+
+    assert collect_batch(source, max_size=3, max_wait=0.01) == [0, 1, 2]
+    assert collect_batch(source, max_size=3, max_wait=0.01) == [3, 4]
+
+def test_batcher_restarts_in_forked_child():
+    batcher = MicroBatchClassifier(EchoClassifier, max_wait_ms=1)
+    assert batcher.predict_batch(["a"]) == [{"class": "a"}]
+
+    pid = os.fork()
+    if pid == 0:
+        # The parent's batching thread does not exist here, a new one must serve the child
+        ok = batcher._thread is None and batcher.predict_batch(["b"]) == [{"class": "b"}]
+        os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0